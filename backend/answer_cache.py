@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class _DocumentAnswers:
+    """LRU of cached answers for one document index"""
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+
+class AnswerCache:
+    """
+    Per-document cache of QA answers.
+
+    Two tiers share the same entries:
+      - exact: keyed on the normalized question text, checked before any
+        embedding call
+      - semantic: reuses an answer whose question embedding has cosine
+        similarity >= `similarity_threshold` with the new question
+
+    Entries expire after `ttl_seconds`; each document keeps at most
+    `max_entries` answers and at most `max_documents` documents are kept,
+    both evicted least-recently-used. invalidate() drops a document when its
+    embeddings change.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_documents: int = None,
+        ttl_seconds: int = None,
+        similarity_threshold: float = None
+    ):
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_PER_DOCUMENT", "200"))
+        self.max_documents = max_documents or int(os.getenv("ANSWER_CACHE_DOCUMENTS", "1000"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        self.similarity_threshold = similarity_threshold or float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+        self._documents: "OrderedDict[str, _DocumentAnswers]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        text = unicodedata.normalize("NFKC", question or "").lower()
+        text = re.sub(r"\s+", " ", text).strip()
+        return text.rstrip("?!. ")
+
+    # 🔹 Lookups
+    def get_exact(self, document_id: str, question: str) -> Optional[Dict]:
+        key = self.normalize(question)
+        with self._lock:
+            answers = self._answers(document_id)
+            entry = answers.entries.get(key) if answers else None
+            if entry and not self._expired(entry):
+                answers.entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["result"]
+        return None
+
+    def get_similar(self, document_id: str, embedding: List[float]) -> Optional[Dict]:
+        """Best cached answer above the similarity threshold; counts a miss otherwise"""
+        query = self._unit(embedding)
+        with self._lock:
+            answers = self._answers(document_id)
+            candidates = [
+                (key, entry) for key, entry in (answers.entries.items() if answers else [])
+                if not self._expired(entry)
+            ]
+
+            if candidates:
+                scores = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    answers.entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return entry["result"]
+
+            self.misses += 1
+        return None
+
+    # 🔹 Updates
+    def put(self, document_id: str, question: str, embedding: List[float], result: Dict):
+        key = self.normalize(question)
+        with self._lock:
+            answers = self._documents.get(document_id)
+            if answers is None:
+                answers = self._documents[document_id] = _DocumentAnswers()
+            self._documents.move_to_end(document_id)
+
+            answers.entries[key] = {
+                "embedding": self._unit(embedding),
+                "result": result,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            answers.entries.move_to_end(key)
+
+            while len(answers.entries) > self.max_entries:
+                answers.entries.popitem(last=False)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def invalidate(self, document_id: str):
+        """Forget every answer for a document whose embeddings changed"""
+        with self._lock:
+            if self._documents.pop(document_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "entries": sum(len(a.entries) for a in self._documents.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
+
+    # 🔹 Internals
+    def _answers(self, document_id: str) -> Optional[_DocumentAnswers]:
+        answers = self._documents.get(document_id)
+        if answers is not None:
+            self._documents.move_to_end(document_id)
+        return answers
+
+    @staticmethod
+    def _expired(entry: Dict) -> bool:
+        return entry["expires_at"] <= time.monotonic()
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+_shared_cache: Optional[AnswerCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Process-wide answer cache"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = AnswerCache()
+        return _shared_cache
@@ -0,0 +1,84 @@
+"""
+Recall and latency of compact embedding search against full-precision search.
+
+Runs offline on synthetic document embeddings (chunks drawn around a few
+dozen topic directions, queries are perturbed chunks) and prints one JSON
+report. Ground truth is the exact float32 cosine top-k.
+
+    python benchmarks/compact_embeddings.py --chunks 2000 --queries 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantization import EMBEDDING_DIMS, binary_codes, two_stage_search  # noqa: E402
+
+
+def synthetic_embeddings(rng, n: int, topics: int, dims: int = EMBEDDING_DIMS) -> np.ndarray:
+    centers = rng.normal(size=(topics, dims))
+    vectors = centers[rng.integers(0, topics, n)] + rng.normal(scale=1.2, size=(n, dims))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def unit(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def run(chunks: int, queries: int, top_k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = synthetic_embeddings(rng, chunks, topics=40)
+    query_rows = rng.integers(0, chunks, queries)
+    query_set = unit(vectors[query_rows] + rng.normal(scale=0.03, size=(queries, EMBEDDING_DIMS))).astype(np.float32)
+
+    truth = [set(np.argsort(-(vectors @ q))[:top_k]) for q in query_set]
+
+    def measure(search):
+        start = time.perf_counter()
+        found = [search(q) for q in query_set]
+        elapsed = (time.perf_counter() - start) / queries
+        recall = np.mean([len(truth[i] & set(found[i])) / top_k for i in range(queries)])
+        return {"recall_at_k": round(float(recall), 4), "ms_per_query": round(elapsed * 1000, 3)}
+
+    report = {"chunks": chunks, "queries": queries, "top_k": top_k, "results": []}
+    report["results"].append({
+        "storage": "float32 x 768 (current)",
+        "bytes_per_vector": 4 * EMBEDDING_DIMS,
+        **measure(lambda q: np.argsort(-(vectors @ q))[:top_k])
+    })
+
+    for dims in (EMBEDDING_DIMS, 384, 256):
+        half = unit(vectors[:, :dims]).astype(np.float16)
+        codes = binary_codes(half)
+        widened = half.astype(np.float32)
+        report["results"].append({
+            "storage": f"float16 x {dims}, exact scan",
+            "bytes_per_vector": 2 * dims,
+            **measure(lambda q: np.argsort(-(widened @ unit(q[:dims])))[:top_k])
+        })
+        for candidates in (20, 50, 100):
+            report["results"].append({
+                "storage": f"float16 x {dims}, binary coarse + rescore of {candidates}",
+                "bytes_per_vector": 2 * dims,
+                **measure(lambda q: two_stage_search(unit(q[:dims]), codes, half, top_k, candidates))
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.chunks, args.queries, args.top_k, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
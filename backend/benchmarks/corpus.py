@@ -0,0 +1,121 @@
+"""
+Deterministic benchmark PDFs.
+
+Pages hold text-only prose drawn from a synthetic vocabulary, with each
+section of the document leaning on its own topic words (so retrieval has
+something to find) and a few fact lines with IDs and emails per page. The
+PDF is written directly, with no dependency beyond the standard library.
+
+    python benchmarks/corpus.py --pages 10,100,500 --out /tmp/corpus
+"""
+import argparse
+import os
+import random
+from typing import List
+
+LINES_PER_PAGE = 48
+WORDS_PER_LINE = 11
+PAGES_PER_SECTION = 5
+
+_SYLLABLES = ["ka", "lo", "mi", "ner", "to", "va", "sel", "ri", "qua", "den", "por", "zu", "fin", "a", "es", "mon"]
+_CONNECTORS = ["the", "of", "and", "to", "in", "for", "with", "is", "on", "that", "by", "as"]
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def page_texts(pages: int, seed: int = 0) -> List[List[str]]:
+    """Lines of text for each page"""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, 3000)
+    document = []
+    topic = []
+    for page in range(pages):
+        if page % PAGES_PER_SECTION == 0:
+            topic = rng.sample(vocabulary, 25)
+
+        lines = []
+        for line in range(LINES_PER_PAGE):
+            if line % 16 == 15:
+                part = f"{rng.choice('ABCDEFGH')}{rng.choice('KLMNPQRS')}-{rng.randint(1000, 9999)}"
+                contact = f"{rng.choice(vocabulary)}.{rng.choice(vocabulary)}@example.com"
+                lines.append(f"Part number {part} is maintained by {contact} for {rng.choice(topic)}.")
+                continue
+            words = [
+                rng.choice(topic) if rng.random() < 0.3
+                else rng.choice(_CONNECTORS) if rng.random() < 0.3
+                else rng.choice(vocabulary)
+                for _ in range(WORDS_PER_LINE)
+            ]
+            words[0] = words[0].capitalize()
+            lines.append(" ".join(words) + ".")
+        document.append(lines)
+    return document
+
+
+def questions(pages: int, count: int, seed: int = 0) -> List[str]:
+    """Questions built from phrases that occur in the document"""
+    document = page_texts(pages, seed)
+    rng = random.Random(seed + 1)
+    asked = []
+    for i in range(count):
+        line = rng.choice(rng.choice(document)).rstrip(".").split()
+        start = rng.randint(0, max(0, len(line) - 5))
+        asked.append(f"What does the document say about {' '.join(line[start:start + 5])}? ({i})")
+    return asked
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """Minimal PDF with one Helvetica text stream per page"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, lines in enumerate(pages):
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        body = "BT /F1 9 Tf 14 TL 40 760 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def generate(pages: int, seed: int = 0) -> bytes:
+    return make_pdf(page_texts(pages, seed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,500", help="comma-separated page counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="directory to write the PDFs to")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for size in (int(p) for p in args.pages.split(",")):
+        path = os.path.join(args.out, f"bench_{size}p.pdf")
+        with open(path, "wb") as f:
+            f.write(generate(size, args.seed))
+        print(path)
@@ -0,0 +1,443 @@
+"""
+Local stand-ins for Supabase and Gemini, for offline benchmarks.
+
+They implement only what the backend calls, answer deterministically and
+sleep for a configurable latency per request, so measurements reflect the
+backend's own work plus a known, repeatable network cost. Pass them to
+VectorStore / QAChain through their constructor arguments.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+EMBEDDING_DIMS = 768
+
+_WORD = re.compile(r"\w+")
+
+
+class Latency:
+    """Simulated latency: a fixed cost per request plus a cost per item"""
+
+    def __init__(self, per_request_ms: float = 0.0, per_item_ms: float = 0.0):
+        self.per_request_ms = per_request_ms
+        self.per_item_ms = per_item_ms
+        self.enabled = True
+
+    def seconds(self, items: int = 0) -> float:
+        if not self.enabled:
+            return 0.0
+        return (self.per_request_ms + self.per_item_ms * items) / 1000
+
+    def wait(self, items: int = 0):
+        delay = self.seconds(items)
+        if delay:
+            time.sleep(delay)
+
+    async def await_(self, items: int = 0):
+        delay = self.seconds(items)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# =========================================================
+# 🗄️ Supabase
+# =========================================================
+class FakeSupabase:
+    """
+    In-memory tables behind the subset of the PostgREST query builder the
+    backend uses, the match_embeddings* and document_chunk_stats RPCs, and
+    a storage bucket.
+    """
+
+    def __init__(self, latency: Latency = None):
+        self.latency = latency or Latency()
+        self.tables: Dict[str, List[Dict]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.requests = Counter()
+        self._lock = threading.RLock()
+        # Embedding matrices per (file_id, column), rebuilt after writes
+        self._matrices: Dict[tuple, tuple] = {}
+        self._version = 0
+        self.storage = SimpleNamespace(from_=lambda bucket: _Bucket(self, bucket))
+
+    def table(self, name: str) -> "_Query":
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Dict) -> SimpleNamespace:
+        def execute(wait: bool = True):
+            self.requests[f"rpc.{name}"] += 1
+            if wait:
+                self.latency.wait()
+            return SimpleNamespace(data=getattr(self, f"_rpc_{name}")(params), count=None)
+        return SimpleNamespace(execute=execute)
+
+    # 🔹 RPCs
+    def _rpc_match_embeddings(self, params: Dict) -> List[Dict]:
+        return self._match(params["filter_file_id"], "embedding", [params["query_embedding"]], params["match_count"])[0]
+
+    def _rpc_match_embeddings_batch(self, params: Dict) -> List[Dict]:
+        results = self._match(params["filter_file_id"], "embedding", params["query_embeddings"], params["match_count"])
+        return [{**row, "query_index": i} for i, rows in enumerate(results) for row in rows]
+
+    def _rpc_match_embeddings_compact(self, params: Dict) -> List[Dict]:
+        return self._match(params["filter_file_id"], "embedding_half", [params["query_embedding"]], params["match_count"])[0]
+
+    def _rpc_match_embeddings_compact_batch(self, params: Dict) -> List[Dict]:
+        results = self._match(params["filter_file_id"], "embedding_half", params["query_embeddings"], params["match_count"])
+        return [{**row, "query_index": i} for i, rows in enumerate(results) for row in rows]
+
+    def _rpc_document_chunk_stats(self, params: Dict) -> List[Dict]:
+        rows = [r for r in self.tables.get("embeddings", []) if r.get("file_id") == params["filter_file_id"]]
+        pages = sorted({r["page"] for r in rows})
+        return [{"total_chunks": len(rows), "page_count": len(pages), "pages": pages or None}]
+
+    def _rpc_prune_embedding_cache(self, params: Dict) -> List[Dict]:
+        return []
+
+    def _match(self, file_id: str, column: str, queries: List[List[float]], top_k: int) -> List[List[Dict]]:
+        """Exact cosine search, as pgvector's <=> without an index"""
+        with self._lock:
+            key = (file_id, column)
+            cached = self._matrices.get(key)
+            if cached is None or cached[0] != self._version:
+                rows = [r for r in self.tables.get("embeddings", []) if r.get("file_id") == file_id and r.get(column)]
+                matrix = np.asarray([r[column] for r in rows], dtype=np.float32).reshape(len(rows), -1)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                cached = (self._version, rows, matrix / norms)
+                self._matrices[key] = cached
+            _, rows, matrix = cached
+
+        if not rows:
+            return [[] for _ in queries]
+        query_matrix = np.asarray(queries, dtype=np.float32)[:, :matrix.shape[1]]
+        scores = query_matrix @ matrix.T
+        k = min(top_k, len(rows))
+        results = []
+        for row_scores in scores:
+            best = np.argpartition(-row_scores, k - 1)[:k]
+            best = best[np.argsort(-row_scores[best])]
+            results.append([
+                {
+                    "id": rows[i].get("id"),
+                    "chunk_id": rows[i]["chunk_id"],
+                    "page": rows[i]["page"],
+                    "content": rows[i]["content"],
+                    "similarity": float(row_scores[i])
+                }
+                for i in best
+            ])
+        return results
+
+    def _touch(self, table: str):
+        if table == "embeddings":
+            self._version += 1
+
+
+class AsyncFakeSupabase:
+    """Async facade over a FakeSupabase, shaped like supabase's AsyncClient"""
+
+    def __init__(self, sync: FakeSupabase):
+        self.sync = sync
+
+    def table(self, name: str) -> "_AsyncQuery":
+        return _AsyncQuery(self.sync.table(name), self.sync.latency)
+
+    def rpc(self, name: str, params: Dict) -> SimpleNamespace:
+        call = self.sync.rpc(name, params)
+
+        async def execute():
+            await self.sync.latency.await_()
+            return await asyncio.to_thread(call.execute, wait=False)
+        return SimpleNamespace(execute=execute)
+
+
+class _AsyncQuery:
+    def __init__(self, query: "_Query", latency: Latency):
+        self._query = query
+        self._latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def chain(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chain
+
+    async def execute(self):
+        await self._latency.await_()
+        return self._query.execute(wait=False)
+
+
+class _Query:
+    def __init__(self, db: FakeSupabase, table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.payload = None
+        self.on_conflict = ""
+        self.filters = []
+        self.orders = []
+        self.offset = 0
+        self.row_limit = None
+
+    # 🔹 Operations
+    def select(self, columns: str = "*", count: str = None):
+        self.operation, self.columns = "select", columns
+        return self
+
+    def insert(self, payload):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "", **kwargs):
+        self.operation, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload: Dict):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # 🔹 Filters
+    def eq(self, column: str, value):
+        if "->>" in column:
+            column, field = column.split("->>")
+            self.filters.append(lambda r: str((r.get(column) or {}).get(field)).lower() == str(value).lower())
+        else:
+            self.filters.append(lambda r: r.get(column) == value or str(r.get(column)) == str(value))
+        return self
+
+    def neq(self, column: str, value):
+        self.filters.append(lambda r: str(r.get(column)) != str(value))
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] > value)
+        return self
+
+    def gte(self, column: str, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] >= value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] < value)
+        return self
+
+    def lte(self, column: str, value):
+        self.filters.append(lambda r: r.get(column) is not None and r[column] <= value)
+        return self
+
+    def in_(self, column: str, values):
+        values = {str(v) for v in values}
+        self.filters.append(lambda r: str(r.get(column)) in values)
+        return self
+
+    def is_(self, column: str, value):
+        self.filters.append(lambda r: r.get(column) is None if value in (None, "null") else r.get(column) == value)
+        return self
+
+    # 🔹 Modifiers
+    def order(self, column: str, desc: bool = False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        self.offset, self.row_limit = start, end - start + 1
+        return self
+
+    def execute(self, wait: bool = True):
+        self.db.requests[f"{self.table}.{self.operation}"] += 1
+        if wait:
+            self.db.latency.wait()
+        with self.db._lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.operation in ("insert", "upsert"):
+                return SimpleNamespace(data=self._write(rows), count=None)
+
+            matched = [r for r in rows if all(f(r) for f in self.filters)]
+            if self.operation == "update":
+                for row in matched:
+                    row.update(self.payload)
+                self.db._touch(self.table)
+                return SimpleNamespace(data=[dict(r) for r in matched], count=None)
+            if self.operation == "delete":
+                ids = {id(r) for r in matched}
+                rows[:] = [r for r in rows if id(r) not in ids]
+                self.db._touch(self.table)
+                return SimpleNamespace(data=matched, count=None)
+
+        for column, desc in reversed(self.orders):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        total = len(matched)
+        matched = matched[self.offset:]
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        return SimpleNamespace(data=[self._project(r) for r in matched], count=total)
+
+    def _write(self, rows: List[Dict]) -> List[Dict]:
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys = [k.strip() for k in self.on_conflict.split(",") if k.strip()] or ["id"]
+        existing = {}
+        if self.operation == "upsert":
+            existing = {tuple(str(r.get(k)) for k in keys): r for r in rows}
+
+        written = []
+        for new in payload:
+            row = existing.get(tuple(str(new.get(k)) for k in keys))
+            if row is not None:
+                row.update(new)
+            else:
+                row = {"id": str(uuid.uuid4()), "created_at": time.time(), **new}
+                rows.append(row)
+                if self.operation == "upsert":
+                    existing[tuple(str(row.get(k)) for k in keys)] = row
+            written.append(dict(row))
+        self.db._touch(self.table)
+        return written
+
+    def _project(self, row: Dict) -> Dict:
+        if self.columns.strip() == "*":
+            return dict(row)
+        projected = {}
+        for column in self.columns.split(","):
+            alias, _, source = column.strip().partition(":")
+            projected[alias] = row.get(source or alias)
+        return projected
+
+
+class _Bucket:
+    def __init__(self, db: FakeSupabase, name: str):
+        self.db = db
+        self.name = name
+
+    def upload(self, path: str, data, options: Dict = None):
+        self.db.latency.wait()
+        if hasattr(data, "read"):
+            data = data.read()
+        elif isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        self.db.files[f"{self.name}/{path}"] = bytes(data)
+
+    def download(self, path: str) -> Optional[bytes]:
+        self.db.latency.wait()
+        return self.db.files.get(f"{self.name}/{path}")
+
+
+# =========================================================
+# 🧠 Gemini
+# =========================================================
+def hashed_embedding(text: str, dims: int = EMBEDDING_DIMS) -> List[float]:
+    """
+    Deterministic bag-of-words vector (feature hashing), so texts sharing
+    words score as similar and retrieval results stay meaningful.
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dims] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if not norm:
+        vector[0], norm = 1.0, 1.0
+    return (vector / norm).tolist()
+
+
+class FakeEmbeddings:
+    """GoogleGenerativeAIEmbeddings stand-in; latency is per request and per text"""
+
+    def __init__(self, latency: Latency = None, model: str = "models/fake-embedding"):
+        self.latency = latency or Latency()
+        self.model = model
+        self.requests = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def _count(self, texts: int):
+        with self._lock:
+            self.requests += 1
+            self.texts += texts
+
+    def embed_documents(self, texts: List[str], batch_size: int = None, task_type: str = None, **kwargs) -> List[List[float]]:
+        self._count(len(texts))
+        self.latency.wait(len(texts))
+        return [hashed_embedding(t) for t in texts]
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        self._count(1)
+        self.latency.wait(1)
+        return hashed_embedding(text)
+
+    async def aembed_documents(self, texts: List[str], batch_size: int = None, task_type: str = None, **kwargs) -> List[List[float]]:
+        self._count(len(texts))
+        await self.latency.await_(len(texts))
+        return [hashed_embedding(t) for t in texts]
+
+    async def aembed_query(self, text: str, **kwargs) -> List[float]:
+        self._count(1)
+        await self.latency.await_(1)
+        return hashed_embedding(text)
+
+
+class FakeChatModel:
+    """
+    ChatGoogleGenerativeAI stand-in. Replies reuse words from the prompt;
+    prompts asking for JSON get a valid structured summary. Latency is per
+    call plus per generated word, and astream() spreads it across chunks.
+    """
+
+    def __init__(self, latency: Latency = None, reply_words: int = 120, model: str = "models/fake-chat"):
+        self.latency = latency or Latency()
+        self.reply_words = reply_words
+        self.model = model
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, prompt) -> str:
+        with self._lock:
+            self.calls += 1
+        text = str(prompt)
+        words = _WORD.findall(text[-4000:]) or ["empty"]
+        body = " ".join(words[(i * 7) % len(words)] for i in range(self.reply_words))
+        if "valid JSON" in text:
+            return json.dumps({"summary": [
+                {"title": f"Section {i + 1}", "content": body, "icon": "📄"} for i in range(5)
+            ]})
+        return body
+
+    def invoke(self, prompt) -> AIMessage:
+        reply = self._reply(prompt)
+        self.latency.wait(len(reply.split()))
+        return AIMessage(content=reply)
+
+    async def ainvoke(self, prompt) -> AIMessage:
+        reply = self._reply(prompt)
+        await self.latency.await_(len(reply.split()))
+        return AIMessage(content=reply)
+
+    async def astream(self, prompt):
+        words = self._reply(prompt).split(" ")
+        await self.latency.await_()
+        for i, word in enumerate(words):
+            if self.latency.enabled and self.latency.per_item_ms:
+                await asyncio.sleep(self.latency.per_item_ms / 1000)
+            yield AIMessageChunk(content=word if i == 0 else " " + word)
@@ -0,0 +1,383 @@
+"""
+Ingest throughput and QA latency, offline.
+
+Runs DocumentProcessor, VectorStore and QAChain against the local stand-ins
+in fakes.py (in-memory Supabase, hashed embeddings, echoing chat model, each
+with a simulated latency) on generated PDFs from corpus.py, and prints one
+JSON report. Every (scenario, size) case runs in a fresh process, so peak
+RSS is per case; it covers the benchmark process only, not extraction
+workers. Request counters cover one run of throughput and summary cases,
+and all questions of retrieve and ask cases; setup is not counted.
+
+Scenarios:
+    extract    PDF -> page text (DocumentProcessor.iter_pages)
+    chunk      page text -> chunks (DocumentProcessor.split_pages)
+    embed      chunks -> embeddings -> rows (VectorStore.store_chunks)
+    retrieve   hybrid search per question (VectorStore.hybrid_search)
+    ask        full answer per question (QAChain.aask)
+    summary    cold map-reduce summary (QAChain.generate_summary)
+
+Tuning environment variables (EMBED_BATCH_SIZE, RETRIEVAL_BACKEND, ...)
+apply as in production. Compare two runs with --compare:
+
+    python benchmarks/pipeline.py --pages 10,100,500 --out before.json
+    python benchmarks/pipeline.py --pages 10,100,500 --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus  # noqa: E402
+from fakes import AsyncFakeSupabase, FakeChatModel, FakeEmbeddings, FakeSupabase, Latency  # noqa: E402
+
+SCENARIOS = ("extract", "chunk", "embed", "retrieve", "ask", "summary")
+FILE_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _latency_summary(seconds: List[float]) -> Dict:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "mean": round(float(ms.mean()), 2)
+    }
+
+
+class Bench:
+    """Fake backends and the backend objects wired to them, for one case"""
+
+    def __init__(self, options: Dict):
+        from answer_cache import AnswerCache
+        from embedding_cache import EmbeddingCache
+        from local_index import LocalIndexCache
+        from summarizer import HierarchicalSummarizer, SummaryCache
+        from vector_store import VectorStore
+
+        scale = options["latency_scale"]
+        self.db = FakeSupabase(Latency(options["db_ms"] * scale))
+        self.embeddings = FakeEmbeddings(Latency(options["embed_ms"] * scale, options["embed_item_ms"] * scale))
+        self.llm = FakeChatModel(Latency(options["llm_ms"] * scale, options["llm_word_ms"] * scale))
+
+        # The default deployment searches through the match_embeddings RPCs
+        # (answered by the fake Supabase); RETRIEVAL_BACKEND=local measures
+        # the in-process index instead, kept in memory only
+        backend = os.getenv("RETRIEVAL_BACKEND", "supabase")
+        self.store = VectorStore(
+            supabase=self.db,
+            embedding_model=self.embeddings,
+            embedding_cache=EmbeddingCache(self.db, self.embeddings.model),
+            async_supabase=AsyncFakeSupabase(self.db),
+            retrieval_backend=backend,
+            local_index=LocalIndexCache(index_dir="") if backend == "local" else None
+        )
+        self._answer_cache = AnswerCache
+        self._summarizer = lambda: HierarchicalSummarizer(self.llm, self.store, cache=SummaryCache(self.db))
+
+    def latency(self, enabled: bool):
+        for latency in (self.db.latency, self.embeddings.latency, self.llm.latency):
+            latency.enabled = enabled
+
+    def ingest(self, pdf: bytes) -> List[Dict]:
+        """Store a document without simulated latency (setup, not measured)"""
+        from document_processor import DocumentProcessor
+
+        self.latency(False)
+        processor = DocumentProcessor()
+        chunks = [
+            {"chunk_id": i, "page": doc.metadata.get("page", 0), "text": doc.page_content}
+            for i, doc in enumerate(processor.iter_chunks(processor.iter_pages(pdf)))
+        ]
+        self.db.table("files").insert({"id": FILE_ID, "processing_status": {"ai_ready": True}}).execute()
+        self.store.store_chunks(FILE_ID, chunks)
+        self.store.store_lexical_index(FILE_ID, chunks)
+        self.latency(True)
+        self.reset_counters()
+        return chunks
+
+    def qa_chain(self):
+        from qa_chain import QAChain
+        return QAChain(
+            FILE_ID,
+            vector_store=self.store,
+            llm=self.llm,
+            summary_llm=self.llm,
+            answer_cache=self._answer_cache(),
+            summarizer=self._summarizer()
+        )
+
+    def reset_counters(self):
+        self.db.requests.clear()
+        self.embeddings.requests = self.embeddings.texts = 0
+        self.llm.calls = 0
+
+    def counters(self) -> Dict:
+        return {
+            "db_requests": sum(self.db.requests.values()),
+            "embed_requests": self.embeddings.requests,
+            "llm_calls": self.llm.calls
+        }
+
+
+# =========================================================
+# 🧪 Scenarios: each returns its measurements
+# =========================================================
+def _extract(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    from document_processor import DocumentProcessor
+    from page_extractor import shutdown_extract_pool
+
+    processor = DocumentProcessor()
+    runs = []
+    try:
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            pages = sum(1 for _ in processor.iter_pages(pdf))
+            runs.append(time.perf_counter() - start)
+    finally:
+        shutdown_extract_pool()
+    return {"seconds": float(np.median(runs)), "pages": pages}
+
+
+def _chunk(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    from document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    pages = processor.extract_pages(pdf)
+    runs = []
+    for _ in range(options["repeat"]):
+        start = time.perf_counter()
+        chunks = len(processor.split_pages(pages))
+        runs.append(time.perf_counter() - start)
+    return {"seconds": float(np.median(runs)), "pages": len(pages), "chunks": chunks}
+
+
+def _embed(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    from document_processor import DocumentProcessor
+    from embedding_cache import EmbeddingCache
+
+    processor = DocumentProcessor()
+    pages = processor.extract_pages(pdf)
+    chunks = [
+        {"chunk_id": i, "page": doc.metadata.get("page", 0), "text": doc.page_content}
+        for i, doc in enumerate(processor.split_pages(pages))
+    ]
+    runs = []
+    for _ in range(options["repeat"]):
+        # Cold caches: every chunk is embedded and written
+        bench.db.tables.pop("embeddings", None)
+        bench.db.tables.pop("embedding_cache", None)
+        bench.store.embedding_cache = EmbeddingCache(bench.db, bench.embeddings.model)
+        bench.reset_counters()
+        start = time.perf_counter()
+        bench.store.store_chunks(FILE_ID, chunks)
+        runs.append(time.perf_counter() - start)
+    return {"seconds": float(np.median(runs)), "pages": len(pages), "chunks": len(chunks)}
+
+
+def _retrieve(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    chunks = bench.ingest(pdf)
+    latencies = []
+    for question in corpus.questions(options["pages"], options["questions"]):
+        start = time.perf_counter()
+        bench.store.hybrid_search(file_id=FILE_ID, query=question, top_k=5)
+        latencies.append(time.perf_counter() - start)
+    return {"latencies": latencies, "chunks": len(chunks)}
+
+
+def _ask(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    chunks = bench.ingest(pdf)
+    qa = bench.qa_chain()
+
+    async def ask_all():
+        latencies = []
+        for question in corpus.questions(options["pages"], options["questions"]):
+            # Measure answering, not the answer cache
+            qa.answer_cache.invalidate(qa.index_id)
+            start = time.perf_counter()
+            await qa.aask(question)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    return {"latencies": asyncio.run(ask_all()), "chunks": len(chunks)}
+
+
+def _summary(bench: Bench, pdf: bytes, options: Dict) -> Dict:
+    chunks = bench.ingest(pdf)
+    latencies = []
+    for _ in range(options["repeat"]):
+        # Cold: no stored summary and no cached map/reduce steps
+        bench.db.table("files").update({"summary": None, "summary_version": None}).eq("id", FILE_ID).execute()
+        bench.db.tables.pop("summary_cache", None)
+        qa = bench.qa_chain()
+        bench.reset_counters()
+        start = time.perf_counter()
+        qa.generate_summary()
+        latencies.append(time.perf_counter() - start)
+    return {"latencies": latencies, "chunks": len(chunks)}
+
+
+_RUNNERS = {
+    "extract": _extract,
+    "chunk": _chunk,
+    "embed": _embed,
+    "retrieve": _retrieve,
+    "ask": _ask,
+    "summary": _summary
+}
+
+
+def run_case(scenario: str, pages: int, options: Dict) -> Dict:
+    """One scenario on one corpus size; runs in its own process"""
+    pdf = corpus.generate(pages, options["seed"])
+    options = {**options, "pages": pages}
+
+    # Keep the report the only output: silence backend logs and stray prints
+    logging.disable(logging.CRITICAL)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bench = Bench(options)
+        measured = _RUNNERS[scenario](bench, pdf, options)
+
+    result = {"scenario": scenario, "pages": pages}
+    if "latencies" in measured:
+        result["chunks"] = measured["chunks"]
+        result["requests"] = len(measured["latencies"])
+        result["latency_ms"] = _latency_summary(measured["latencies"])
+    else:
+        seconds = measured["seconds"]
+        result["seconds"] = round(seconds, 4)
+        result["pages_per_s"] = round(measured["pages"] / seconds, 2)
+        if "chunks" in measured:
+            result["chunks"] = measured["chunks"]
+            result["chunks_per_s"] = round(measured["chunks"] / seconds, 2)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result.update(bench.counters())
+    return result
+
+
+# =========================================================
+# 📊 Report
+# =========================================================
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+_COMPARED = ("pages_per_s", "chunks_per_s", "latency_ms.p50", "latency_ms.p95", "peak_rss_mb")
+
+
+def _metric(result: Dict, name: str):
+    value = result
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(baseline: Dict, report: Dict) -> List[str]:
+    """One line per metric present in both reports, with the relative change"""
+    before = {(r["scenario"], r["pages"]): r for r in baseline["results"]}
+    lines = []
+    for result in report["results"]:
+        old = before.get((result["scenario"], result["pages"]))
+        if not old:
+            continue
+        for name in _COMPARED:
+            a, b = _metric(old, name), _metric(result, name)
+            if a and b is not None:
+                lines.append(f"{result['scenario']:>8} {result['pages']:>5}p  {name:<15} {a:>10} -> {b:<10} ({(b - a) / a:+.1%})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,500", help="comma-separated corpus sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--questions", type=int, default=20, help="questions per retrieve/ask case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per throughput/summary case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-ms", type=float, default=5.0, help="Supabase latency per request")
+    parser.add_argument("--embed-ms", type=float, default=80.0, help="embedding latency per request")
+    parser.add_argument("--embed-item-ms", type=float, default=0.5, help="embedding latency per text")
+    parser.add_argument("--llm-ms", type=float, default=300.0, help="LLM latency per call")
+    parser.add_argument("--llm-word-ms", type=float, default=2.0, help="LLM latency per generated word")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every latency; 0 measures CPU only")
+    parser.add_argument("--out", help="write the report here instead of stdout")
+    parser.add_argument("--compare", help="earlier report to compare against (printed to stderr)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    options = {
+        "questions": args.questions,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "db_ms": args.db_ms,
+        "embed_ms": args.embed_ms,
+        "embed_item_ms": args.embed_item_ms,
+        "llm_ms": args.llm_ms,
+        "llm_word_ms": args.llm_word_ms,
+        "latency_scale": args.latency_scale,
+        "retrieval_backend": os.getenv("RETRIEVAL_BACKEND", "supabase")
+    }
+    report = {
+        "benchmark": "pipeline",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": []
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for pages in (int(p) for p in args.pages.split(",")):
+        for scenario in scenarios:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_case, scenario, pages, options).result()
+            report["results"].append(result)
+            print(f"{scenario:>8} {pages:>5}p done", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), report)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from functools import lru_cache
+from supabase import acreate_client, create_client, AsyncClient, Client
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process-wide API clients. Each one owns a pooled HTTP connection and is
+# safe to share between threads, so they are built once and reused by every
+# request instead of being recreated per QAChain / VectorStore.
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+def _google_api_key() -> str:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in .env")
+    return api_key
+
+
+@lru_cache(maxsize=None)
+def get_supabase() -> Client:
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    )
+
+
+_async_supabase: AsyncClient = None
+_async_supabase_lock = asyncio.Lock()
+
+
+async def get_async_supabase() -> AsyncClient:
+    """Shared async client for the request path; created on first use inside the event loop"""
+    global _async_supabase
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(
+                    os.getenv("SUPABASE_URL"),
+                    os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+                )
+    return _async_supabase
+
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> GoogleGenerativeAIEmbeddings:
+    # Google embeddings (768 dimensions)
+    return GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        google_api_key=_google_api_key()
+    )
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str, temperature: float, max_output_tokens: int = None) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=_google_api_key(),
+        temperature=temperature,
+        max_output_tokens=max_output_tokens
+    )
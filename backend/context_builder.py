@@ -0,0 +1,174 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from metrics import QA_CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+
+class TokenCounter:
+    """
+    Counts tokens with the Gemini tokenizer run locally (google-genai's
+    LocalTokenizer on sentencepiece). The tokenizer model is downloaded once
+    and cached, so the counter is built at startup (and the Docker image
+    prefetches the model). Falls back to ~4 characters per token, with a
+    warning, when the tokenizer cannot be loaded.
+    """
+
+    def __init__(self, model: str):
+        self.model = model.split("/")[-1]
+        self._tokenizer = None
+        self._warned = False
+        try:
+            from google.genai.local_tokenizer import LocalTokenizer
+            self._tokenizer = LocalTokenizer(model_name=self.model)
+            logger.info(f"🔢 Counting {self.model} tokens with the local tokenizer")
+        except Exception as e:
+            self._warned = True
+            logger.warning(f"⚠️ Local tokenizer unavailable for {self.model}, estimating tokens as chars/4: {e}")
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            try:
+                return self._tokenizer.count_tokens(text).total_tokens
+            except Exception as e:
+                if not self._warned:
+                    self._warned = True
+                    logger.warning(f"⚠️ Local tokenizer failed for {self.model}, estimating tokens as chars/4: {e}")
+        return max(1, len(text) // 4)
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """Process-wide token counter per model"""
+    with _counters_lock:
+        if model not in _counters:
+            _counters[model] = TokenCounter(model)
+        return _counters[model]
+
+
+def _merge_text(first: str, second: str) -> str:
+    """Join consecutive chunks, dropping the text they share through splitter overlap"""
+    probe = second[:50]
+    position = first.rfind(probe, max(0, len(first) - len(second) - 50))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.rfind(probe, 0, position)
+    return f"{first} {second}"
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _truncate_to_sentence(text: str, counter: TokenCounter, max_tokens: int) -> str:
+    """Longest prefix ending at a sentence boundary that fits in max_tokens"""
+    best = ""
+    for match in _SENTENCE_END.finditer(text):
+        candidate = text[:match.end()]
+        if counter.count(candidate) > max_tokens:
+            break
+        best = candidate
+    return best
+
+
+class ContextBuilder:
+    """
+    Turns retrieved chunks into the QA prompt context.
+
+    Chunks from the same page with consecutive chunk ids are merged into one
+    block without their overlapping text, blocks whose text is already
+    contained in a better-ranked block are dropped, and blocks are packed in
+    rank order until `max_tokens` is reached. The last block that does not
+    fit is cut at a sentence boundary rather than mid-sentence.
+    """
+
+    def __init__(self, model: str, max_tokens: int = None, counter: Optional[TokenCounter] = None):
+        self.max_tokens = max_tokens or int(os.getenv("QA_CONTEXT_TOKENS", "1500"))
+        self.counter = counter or get_token_counter(model)
+
+    def build(self, chunks: List[Dict]) -> Tuple[str, List[int]]:
+        """Returns (context, pages used); context is empty when no chunk has text"""
+        blocks = self._merge(chunks)
+
+        selected, seen, used = [], [], 0
+        for block in sorted(blocks, key=lambda b: b["rank"]):
+            normalized = _normalize(block["text"])
+            if any(normalized in other for other in seen):
+                continue
+
+            text = f"(Page {block['page']}) {block['text']}"
+            tokens = self.counter.count(text)
+            if used + tokens > self.max_tokens:
+                text = _truncate_to_sentence(text, self.counter, self.max_tokens - used)
+                # A sentence or two out of context is not worth the tokens
+                if self.counter.count(text) < 50:
+                    continue
+                tokens = self.counter.count(text)
+
+            selected.append({**block, "text": text})
+            seen.append(normalized)
+            used += tokens
+            if used >= self.max_tokens:
+                break
+
+        # Present blocks in document order
+        selected.sort(key=lambda b: (b["page"], b["first_chunk"]))
+        pages = sorted({b["page"] for b in selected})
+        QA_CONTEXT_TOKENS.inc(used)
+        logger.debug(f"📚 Context: {len(selected)} blocks, {used} tokens"
+              f"{'' if self.counter.exact else ' (estimated)'}, pages {pages}")
+        return "\n\n".join(b["text"] for b in selected), pages
+
+    @staticmethod
+    def _merge(chunks: List[Dict]) -> List[Dict]:
+        ranked, seen_ids = [], set()
+        for rank, chunk in enumerate(chunks):
+            text = (chunk.get("content") or chunk.get("text") or "").strip()
+            chunk_id = chunk.get("chunk_id")
+            if not text or chunk_id in seen_ids:
+                continue
+            seen_ids.add(chunk_id)
+            ranked.append({
+                "rank": rank,
+                "page": chunk.get("page", 0),
+                "chunk_id": chunk_id,
+                "text": text
+            })
+
+        blocks = []
+        for chunk in sorted(ranked, key=lambda c: (c["page"], c["chunk_id"])):
+            previous = blocks[-1] if blocks else None
+            if (
+                previous
+                and previous["page"] == chunk["page"]
+                and chunk["chunk_id"] == previous["last_chunk"] + 1
+            ):
+                previous["text"] = _merge_text(previous["text"], chunk["text"])
+                previous["last_chunk"] = chunk["chunk_id"]
+                previous["rank"] = min(previous["rank"], chunk["rank"])
+                continue
+            blocks.append({
+                "rank": chunk["rank"],
+                "page": chunk["page"],
+                "first_chunk": chunk["chunk_id"],
+                "last_chunk": chunk["chunk_id"],
+                # The splitter keeps separators at the start of a chunk
+                "text": chunk["text"].lstrip(".,;: ")
+            })
+        return blocks
@@ -1,18 +1,30 @@
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredPDFLoader
+from langchain_community.document_loaders import UnstructuredPDFLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+from page_extractor import iter_pages_parallel, shutdown_extract_pool
+import logging
+import mmap
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
 import unicodedata
+from contextlib import contextmanager
 import re
 from io import BytesIO
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Iterator, List, Union
+
+logger = logging.getLogger(__name__)
 
 
 class DocumentProcessor:
-    def __init__(self, chunk_size=1200, chunk_overlap=250, use_ocr=False):
+    def __init__(self, chunk_size=1200, chunk_overlap=250, use_ocr=False, extract_workers=None):
         """
         chunk_size: Smaller chunks improve retrieval precision
         chunk_overlap: Keeps context between chunks
         use_ocr: Enable if PDFs are scanned images
+        extract_workers: Processes used to extract text from large PDFs
         """
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
@@ -20,6 +32,10 @@ class DocumentProcessor:
             separators=["\n\n", "\n", ".", "۔", " ", ""]
         )
         self.use_ocr = use_ocr
+        self.extract_workers = extract_workers or int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+        # Below this, worker startup and per-worker PDF parsing cost more than they save
+        self.parallel_min_pages = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "64"))
+        self.pages_per_task = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
 
     # 🔹 Clean extracted text
     def _clean_text(self, text: str) -> str:
@@ -36,51 +52,130 @@ class DocumentProcessor:
 
         return text.strip()
 
-    # 🔹 Process PDF into cleaned chunks
-    def process(self, pdf_source: Union[str, bytes, BytesIO]):
+    @staticmethod
+    @contextmanager
+    def _open(pdf_source: Union[str, bytes, BytesIO]) -> Iterator[Union[mmap.mmap, BytesIO]]:
+        """Readable stream over the PDF; a mapping opened here is closed on exit"""
+        if isinstance(pdf_source, (bytes, BytesIO)):
+            yield BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source
+            return
+        if isinstance(pdf_source, str):
+            if not Path(pdf_source).exists():
+                raise FileNotFoundError(f"PDF not found: {pdf_source}")
+            # pypdf reads a path fully into memory; a mapping pages in on demand
+            with open(pdf_source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+            return
+        raise TypeError("pdf_source must be str, bytes, or BytesIO")
+
+    # 🔹 Page count from the PDF structure, without extracting any text
+    def count_pages(self, pdf_source: Union[str, bytes, BytesIO]) -> int:
+        with self._open(pdf_source) as stream:
+            return len(PdfReader(stream).pages)
+
+    # 🔹 Extract raw text page by page
+    def iter_pages(self, pdf_source: Union[str, bytes, BytesIO]) -> Iterator[str]:
         """
+        Yield the raw text of each page, in page order, as the PDF is parsed,
+        so later stages can start on page 1 before the last page is read.
+
         pdf_source: can be
           - file path (str)
           - raw PDF bytes (bytes)
           - BytesIO object
         """
-        # Determine loader
-        if isinstance(pdf_source, (bytes, BytesIO)):
-            stream = BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source
-            loader = UnstructuredPDFLoader(stream) if self.use_ocr else PyPDFLoader(stream)
-        elif isinstance(pdf_source, str):
-            if not Path(pdf_source).exists():
-                raise FileNotFoundError(f"PDF not found: {pdf_source}")
-            loader = UnstructuredPDFLoader(pdf_source) if self.use_ocr else PyPDFLoader(pdf_source)
-        else:
-            raise TypeError("pdf_source must be str, bytes, or BytesIO")
+        logger.info("📖 Loading PDF...")
+        if self.use_ocr:
+            if not isinstance(pdf_source, str):
+                raise TypeError("OCR extraction requires a file path")
+            for page in UnstructuredPDFLoader(pdf_source).lazy_load():
+                yield page.page_content
+            return
 
-        print("📖 Loading PDF...")
-        pages = loader.load()
+        # Closed when the pages are exhausted or the caller drops the generator
+        with self._open(pdf_source) as stream:
+            reader = PdfReader(stream)
+            page_count = len(reader.pages)
+            extracted = 0
+            if self.extract_workers > 1 and page_count >= self.parallel_min_pages:
+                logger.info(f"⚡ Extracting {page_count} pages on {self.extract_workers} processes")
+                try:
+                    for text in self._iter_pages_parallel(pdf_source, page_count):
+                        extracted += 1
+                        yield text
+                    return
+                except BrokenProcessPool as e:
+                    # A crashed worker breaks the pool; finish in this process
+                    logger.warning(f"⚠️ Extraction pool failed after {extracted} pages, continuing serially: {e}")
+                    shutdown_extract_pool()
 
-        cleaned_pages = []
-        for page_number, page in enumerate(pages, start=1):
-            cleaned_text = self._clean_text(page.page_content)
+            for index in range(extracted, page_count):
+                yield reader.pages[index].extract_text() or ""
 
-            if not cleaned_text.strip():
-                continue
+    def _iter_pages_parallel(self, pdf_source: Union[str, bytes, BytesIO], page_count: int) -> Iterator[str]:
+        # Workers memory-map a file; in-memory PDFs are written to one first
+        if isinstance(pdf_source, str):
+            yield from iter_pages_parallel(pdf_source, page_count, self.extract_workers, self.pages_per_task)
+            return
+
+        data = pdf_source if isinstance(pdf_source, bytes) else pdf_source.getvalue()
+        spool_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        with tempfile.NamedTemporaryFile(suffix=".pdf", dir=spool_dir) as spool:
+            spool.write(data)
+            spool.flush()
+            yield from iter_pages_parallel(spool.name, page_count, self.extract_workers, self.pages_per_task)
+
+    # 🔹 Extract raw text of every page in a single pass
+    def extract_pages(self, pdf_source: Union[str, bytes, BytesIO]) -> List[str]:
+        """
+        Parse the PDF once and return the raw text of each page, in page order.
 
-            page.page_content = cleaned_text
-            page.metadata["page"] = page_number
-            cleaned_pages.append(page)
+        The result is meant to be reused for page/word counts, language
+        detection and chunking, so the PDF never has to be parsed twice.
+        """
+        return list(self.iter_pages(pdf_source))
 
-        print(f"🧹 Cleaned {len(cleaned_pages)} pages")
+    # 🔹 Split page texts into cleaned chunks, page by page
+    def iter_chunks(self, pages: Iterable[str]) -> Iterator[Document]:
+        """
+        pages: raw page texts, e.g. from iter_pages(); consumed lazily
 
-        print("🔪 Splitting into chunks...")
-        chunks = self.splitter.split_documents(cleaned_pages)
+        Chunks never span pages, so splitting page by page yields exactly
+        the chunks (and chunk_index values) split_pages() would.
+        """
+        index = 0
+        for page_number, text in enumerate(pages, start=1):
+            cleaned_text = self._clean_text(text)
 
-        final_chunks = []
-        for i, chunk in enumerate(chunks):
-            text = chunk.page_content.strip()
-            if len(text) < 30:
+            if not cleaned_text.strip():
                 continue
-            chunk.metadata["chunk_index"] = i
-            final_chunks.append(chunk)
 
-        print(f"✅ Created {len(final_chunks)} clean chunks")
+            page = Document(page_content=cleaned_text, metadata={"page": page_number})
+            for chunk in self.splitter.split_documents([page]):
+                chunk_index = index
+                index += 1
+                if len(chunk.page_content.strip()) < 30:
+                    continue
+                chunk.metadata["chunk_index"] = chunk_index
+                yield chunk
+
+    # 🔹 Split extracted page texts into cleaned chunks
+    def split_pages(self, pages: List[str]) -> List[Document]:
+        """
+        pages: raw page texts as returned by extract_pages()
+        """
+        logger.info("🔪 Splitting into chunks...")
+        final_chunks = list(self.iter_chunks(pages))
+
+        logger.info(f"✅ Created {len(final_chunks)} clean chunks")
         return final_chunks
+
+    # 🔹 Process PDF into cleaned chunks
+    def process(self, pdf_source: Union[str, bytes, BytesIO]):
+        """
+        pdf_source: can be
+          - file path (str)
+          - raw PDF bytes (bytes)
+          - BytesIO object
+        """
+        return self.split_pages(self.extract_pages(pdf_source))
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Keys per `in` filter, keeps the PostgREST URL well under common limits
+_LOOKUP_CHUNK = 50
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of document embeddings.
+
+    Keys are a SHA-256 of the embedding model name and the normalized chunk
+    text, so identical chunks from re-uploads or new revisions of a document
+    are never embedded twice. Lookups hit an in-process LRU first and then
+    the `embedding_cache` table; entries found in the table are promoted to
+    the LRU.
+    """
+
+    def __init__(self, supabase, model: str, max_entries: int = None, store_max_rows: int = None):
+        self.supabase = supabase
+        self.model = model
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))
+        self.store_max_rows = store_max_rows or int(os.getenv("EMBEDDING_CACHE_STORE_MAX_ROWS", "1000000"))
+        self.prune_every = int(os.getenv("EMBEDDING_CACHE_PRUNE_EVERY", "5000"))
+
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        self.local_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # 🔹 Cache keys
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text or "")
+        return re.sub(r"\s+", " ", text).strip()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model}\x00{self.normalize(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    # 🔹 Lookups
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return the cached embedding for each text, or None on a miss"""
+        keys = [self.key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    found[key] = self._local[key]
+
+        missing = list({key for key in keys if key not in found})
+        stored = self._load_from_store(missing) if missing else {}
+        if stored:
+            self._remember(stored)
+            found.update(stored)
+
+        with self._lock:
+            for key in keys:
+                if key in stored:
+                    self.store_hits += 1
+                elif key in found:
+                    self.local_hits += 1
+                else:
+                    self.misses += 1
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        entries = {self.key(text): embedding for text, embedding in zip(texts, embeddings)}
+        if not entries:
+            return
+
+        self._remember(entries)
+        self._save_to_store(entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.local_hits + self.store_hits + self.misses
+            return {
+                "entries": len(self._local),
+                "max_entries": self.max_entries,
+                "local_hits": self.local_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.local_hits + self.store_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    # 🔹 Internals
+    def _remember(self, entries: Dict[str, List[float]]):
+        with self._lock:
+            for key, embedding in entries.items():
+                self._local[key] = embedding
+                self._local.move_to_end(key)
+
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self.evictions += 1
+
+    def _load_from_store(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        try:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                result = self.supabase.table("embedding_cache")\
+                    .select("key, embedding")\
+                    .in_("key", keys[start:start + _LOOKUP_CHUNK])\
+                    .execute()
+
+                for row in result.data or []:
+                    found[row["key"]] = row["embedding"]
+        except Exception as e:
+            # The cache is an optimization; never fail an ingest because of it
+            logger.warning(f"⚠️ Embedding cache lookup failed: {e}")
+        return found
+
+    def _save_to_store(self, entries: Dict[str, List[float]]):
+        try:
+            self.supabase.table("embedding_cache").upsert(
+                [{"key": key, "model": self.model, "embedding": embedding} for key, embedding in entries.items()],
+                on_conflict="key",
+                ignore_duplicates=True
+            ).execute()
+
+            with self._lock:
+                self._writes_since_prune += len(entries)
+                should_prune = self._writes_since_prune >= self.prune_every
+                if should_prune:
+                    self._writes_since_prune = 0
+
+            if should_prune:
+                self.supabase.rpc("prune_embedding_cache", {"max_rows": self.store_max_rows}).execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+
+_shared_caches: Dict[str, EmbeddingCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache(supabase, model: str) -> EmbeddingCache:
+    """Process-wide cache per embedding model"""
+    with _shared_lock:
+        if model not in _shared_caches:
+            _shared_caches[model] = EmbeddingCache(supabase, model)
+        return _shared_caches[model]
@@ -0,0 +1,142 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from metrics import INGEST_QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised when a job is submitted while every queue slot (or its tenant's share) is taken."""
+
+
+class IngestQueue:
+    """
+    Bounded, fair-share worker pool for PDF ingestion.
+
+    Jobs run on a thread pool so the blocking Supabase, pypdf and embedding
+    calls never touch the event loop. At most `max_workers` jobs run at once
+    and at most `max_queue` more may wait, no more than `max_queue_per_tenant`
+    of them from one tenant; beyond that submit() refuses work.
+
+    A free worker takes the next job from the tenant with the fewest running
+    jobs, round-robin among equals, and within that tenant the smallest
+    document first. A bulk upload therefore cannot starve other tenants, and
+    small documents finish early.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, max_queue_per_tenant: int = None):
+        self.max_workers = max_workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.max_queue = max_queue or int(os.getenv("INGEST_QUEUE_SIZE", "50"))
+        self.max_queue_per_tenant = max_queue_per_tenant or int(
+            os.getenv("INGEST_TENANT_QUEUE_SIZE", str(max(1, self.max_queue // 2)))
+        )
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="ingest"
+        )
+        self._lock = threading.Lock()
+        # tenant -> heap of (size, seq, enqueued_at, future, fn, args)
+        self._pending: Dict[str, List] = {}
+        self._running: Dict[str, int] = {}
+        # tenant -> sequence number of its last dispatch, for round-robin
+        self._served: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+
+        logger.info(
+            f"🧵 Ingest pool ready ({self.max_workers} workers, queue size {self.max_queue}, "
+            f"{self.max_queue_per_tenant} per tenant)"
+        )
+
+    def full(self, tenant: str = None) -> bool:
+        """No queue slot left, overall or (when given) for `tenant`"""
+        with self._lock:
+            return self._full(tenant)
+
+    def _full(self, tenant: str = None) -> bool:
+        if self._queued >= self.max_queue:
+            return True
+        return tenant is not None and len(self._pending.get(tenant, ())) >= self.max_queue_per_tenant
+
+    def submit(self, fn: Callable, *args, tenant: str = "", size: int = 0) -> Future:
+        """
+        Queue a job for `tenant`; `size` (e.g. bytes) orders its jobs,
+        smallest first. Raises IngestQueueFull when no slot is left.
+        """
+        future = Future()
+        with self._lock:
+            if self._queued >= self.max_queue:
+                raise IngestQueueFull(f"Ingest queue is full ({self.max_queue} jobs waiting)")
+            if len(self._pending.get(tenant, ())) >= self.max_queue_per_tenant:
+                raise IngestQueueFull(f"Tenant has {self.max_queue_per_tenant} ingest jobs waiting")
+            self._queued += 1
+            heapq.heappush(
+                self._pending.setdefault(tenant, []),
+                (size, next(self._seq), time.monotonic(), future, fn, args)
+            )
+
+        # One dispatch per job; each picks whichever job is due when a worker frees up
+        self._executor.submit(self._run_next)
+        return future
+
+    def _run_next(self):
+        with self._lock:
+            tenant = min(self._pending, key=lambda t: (self._running.get(t, 0), self._served.get(t, -1)))
+            jobs = self._pending[tenant]
+            _, _, enqueued_at, future, fn, args = heapq.heappop(jobs)
+            if not jobs:
+                del self._pending[tenant]
+            self._queued -= 1
+            self._in_flight += 1
+            self._running[tenant] = self._running.get(tenant, 0) + 1
+            self._served[tenant] = next(self._seq)
+
+        INGEST_QUEUE_SECONDS.observe(time.monotonic() - enqueued_at)
+        failed = False
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    failed = True
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._running[tenant] -= 1
+                if not self._running[tenant]:
+                    del self._running[tenant]
+                    if tenant not in self._pending:
+                        self._served.pop(tenant, None)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "max_queue_per_tenant": self.max_queue_per_tenant,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+                "tenants_waiting": len(self._pending),
+                "tenants_running": len(self._running),
+                "completed": self._completed,
+                "failed": self._failed
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
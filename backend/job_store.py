@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """
+    Persistent ingestion jobs kept in the `ingest_jobs` table.
+
+    A job moves queued -> running -> completed | failed. While a job runs,
+    keep_alive() refreshes `updated_at` every lease/3 seconds from a
+    background thread; a running job whose lease has expired is assumed to
+    belong to a dead worker and can be claimed again.
+    """
+
+    def __init__(self, supabase, lease_seconds: int = None, max_attempts: int = None):
+        self.supabase = supabase
+        self.lease_seconds = lease_seconds or int(os.getenv("INGEST_JOB_LEASE", "600"))
+        self.max_attempts = max_attempts or int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+
+    def enqueue(self, file_id: str, file_name: str, tenant_id: str = None, size_bytes: int = None) -> Dict:
+        """
+        Create (or reset) the job for a file and return it. The tenant and
+        size are kept so recovered jobs are scheduled like fresh ones.
+        """
+        result = self.supabase.table("ingest_jobs").upsert({
+            "file_id": file_id,
+            "file_name": file_name,
+            "tenant_id": tenant_id,
+            "size_bytes": size_bytes,
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "updated_at": _now()
+        }, on_conflict="file_id").execute()
+
+        return result.data[0]
+
+    def claim(self, job: Dict) -> Optional[Dict]:
+        """
+        Mark a job as running.
+
+        The update only matches if the row is unchanged since `job` was read,
+        so two workers can never claim the same job. Returns None when the
+        claim was lost or the job ran out of attempts.
+        """
+        if job["attempts"] >= self.max_attempts:
+            self.fail(job["id"], f"Gave up after {job['attempts']} attempts")
+            return None
+
+        result = self.supabase.table("ingest_jobs").update({
+            "status": "running",
+            "attempts": job["attempts"] + 1,
+            "updated_at": _now()
+        }).eq("id", job["id"]).eq("updated_at", job["updated_at"]).execute()
+
+        return result.data[0] if result.data else None
+
+    def heartbeat(self, job_id: str):
+        """Extend the lease of a running job"""
+        self.supabase.table("ingest_jobs").update({
+            "updated_at": _now()
+        }).eq("id", job_id).execute()
+
+    @contextmanager
+    def keep_alive(self, job_id: str):
+        """
+        Heartbeat a claimed job from a background thread for as long as the
+        block runs, so no stage (extraction, indexing, summary) outlives the
+        lease and gets the job reclaimed by another worker.
+        """
+        stop = threading.Event()
+        interval = max(1.0, self.lease_seconds / 3)
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    self.heartbeat(job_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f"lease-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def is_last_attempt(self, job: Dict) -> bool:
+        """A failure of this (claimed) attempt fails the job for good"""
+        return job["attempts"] >= self.max_attempts
+
+    def complete(self, job_id: str):
+        self.supabase.table("ingest_jobs").update({
+            "status": "completed",
+            "error": None,
+            "updated_at": _now()
+        }).eq("id", job_id).execute()
+
+    def fail(self, job_id: str, error: str):
+        self.supabase.table("ingest_jobs").update({
+            "status": "failed",
+            "error": error,
+            "updated_at": _now()
+        }).eq("id", job_id).execute()
+
+    def release(self, job: Dict, error: str):
+        """Return a failed job to the queue, or fail it for good once out of attempts"""
+        if self.is_last_attempt(job):
+            self.fail(job["id"], error)
+            return
+
+        self.supabase.table("ingest_jobs").update({
+            "status": "queued",
+            "error": error,
+            "updated_at": _now()
+        }).eq("id", job["id"]).execute()
+
+    def recoverable(self) -> List[Dict]:
+        """Queued jobs plus running jobs whose lease has expired"""
+        expired = (datetime.now(timezone.utc) - timedelta(seconds=self.lease_seconds)).isoformat()
+
+        result = self.supabase.table("ingest_jobs")\
+            .select("*")\
+            .or_(f"status.eq.queued,and(status.eq.running,updated_at.lt.{expired})")\
+            .order("created_at")\
+            .execute()
+
+        return result.data if result.data else []
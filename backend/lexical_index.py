@@ -0,0 +1,169 @@
+import base64
+import json
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Words, plus compounds such as emails, IDs and part numbers ("ab-1234",
+# "jane.doe@example.com"), which are indexed whole and as their parts
+_TOKEN = re.compile(r"\w+(?:[.@_/-]\w+)*")
+_PART = re.compile(r"[.@_/-]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer((text or "").lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _PART.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over one document's chunks.
+
+    Postings point at positions in `chunk_ids`; the whole index serializes
+    to a zlib-compressed JSON string for the `lexical_indexes` table.
+    """
+
+    def __init__(self, chunk_ids: List[int], pages: List[int], lengths: List[int], postings: Dict[str, List[List[int]]]):
+        self.chunk_ids = chunk_ids
+        self.pages = pages
+        self.lengths = lengths
+        self.postings = postings
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, chunks: List[Dict]) -> "LexicalIndex":
+        """Chunks carry chunk_id, page and text"""
+        chunk_ids, pages, lengths = [], [], []
+        postings: Dict[str, List[List[int]]] = {}
+
+        for position, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            chunk_ids.append(chunk["chunk_id"])
+            pages.append(chunk.get("page", 0))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                entry = postings.setdefault(term, [[], []])
+                entry[0].append(position)
+                entry[1].append(tf)
+
+        return cls(chunk_ids, pages, lengths, postings)
+
+    def search(self, query: str, top_k: int = 20, k1: float = 1.2, b: float = 0.75) -> List[Dict]:
+        """Best chunks by BM25 as {chunk_id, page, score}"""
+        n = len(self.chunk_ids)
+        if not n:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if not entry:
+                continue
+            positions, tfs = entry
+            idf = math.log(1 + (n - len(positions) + 0.5) / (len(positions) + 0.5))
+            for position, tf in zip(positions, tfs):
+                norm = k1 * (1 - b + b * self.lengths[position] / self.avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+        return [
+            {"chunk_id": self.chunk_ids[position], "page": self.pages[position], "score": score}
+            for position, score in best
+        ]
+
+    def dumps(self) -> str:
+        payload = json.dumps({
+            "chunk_ids": self.chunk_ids,
+            "pages": self.pages,
+            "lengths": self.lengths,
+            "postings": self.postings
+        }, separators=(",", ":"))
+        return base64.b64encode(zlib.compress(payload.encode("utf-8"), 6)).decode("ascii")
+
+    @classmethod
+    def loads(cls, data: str) -> "LexicalIndex":
+        payload = json.loads(zlib.decompress(base64.b64decode(data)).decode("utf-8"))
+        return cls(payload["chunk_ids"], payload["pages"], payload["lengths"], payload["postings"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+    """
+    Fuse ranked chunk lists by sum of 1 / (k + rank), keyed on chunk_id.
+    The first list's entry is kept for chunks found by several rankings.
+    """
+    fused: Dict[int, Dict] = {}
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            chunk_id = chunk["chunk_id"]
+            fused.setdefault(chunk_id, chunk)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+
+    best = sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:top_k]
+    return [{**fused[chunk_id], "rrf_score": scores[chunk_id]} for chunk_id in best]
+
+
+class LexicalIndexCache:
+    """
+    LRU of loaded lexical indexes keyed by file_id.
+
+    A document without a stored index may be one still ingesting, so that
+    answer is only remembered for `negative_ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = None, negative_ttl: float = None):
+        self.max_entries = max_entries or int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "256"))
+        self.negative_ttl = negative_ttl if negative_ttl is not None \
+            else float(os.getenv("LEXICAL_INDEX_NEGATIVE_TTL", "30"))
+        # file_id -> (index, expiry); only "no index" entries expire
+        self._indexes: "OrderedDict[str, Tuple[Optional[LexicalIndex], Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_id: str):
+        """(found, index); index is None for documents recently seen without a lexical index"""
+        with self._lock:
+            entry = self._indexes.get(file_id)
+            if entry is None:
+                return False, None
+            index, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._indexes[file_id]
+                return False, None
+            self._indexes.move_to_end(file_id)
+            return True, index
+
+    def put(self, file_id: str, index: Optional[LexicalIndex]):
+        expires_at = None if index is not None else time.monotonic() + self.negative_ttl
+        with self._lock:
+            self._indexes[file_id] = (index, expires_at)
+            self._indexes.move_to_end(file_id)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+    def invalidate(self, file_id: str):
+        with self._lock:
+            self._indexes.pop(file_id, None)
+
+
+_shared_cache: Optional[LexicalIndexCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_lexical_index_cache() -> LexicalIndexCache:
+    """Process-wide lexical index cache"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LexicalIndexCache()
+        return _shared_cache
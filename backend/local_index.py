@@ -0,0 +1,359 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LocalVectorIndex:
+    """
+    In-memory cosine index over one document's chunk embeddings.
+
+    Small documents are scanned exactly (one matrix-vector product). Larger
+    ones use IVF-flat: vectors are clustered with spherical k-means and
+    stored grouped by cluster, and a query only scores the `nprobe` clusters
+    whose centroids are closest to it.
+    """
+
+    def __init__(self, vectors: np.ndarray, meta: List[Dict], centroids: np.ndarray = None, offsets: np.ndarray = None):
+        self.vectors = vectors
+        self.meta = meta
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, rows: List[Dict], ivf_min: int = 4096, kmeans_iterations: int = 10) -> "LocalVectorIndex":
+        """Rows carry id, chunk_id, page, content and embedding"""
+        meta = [
+            {"id": r.get("id"), "chunk_id": r.get("chunk_id"), "page": r.get("page"), "content": r.get("content")}
+            for r in rows
+        ]
+        if not rows:
+            # No stored chunks: every search returns nothing
+            return cls(np.zeros((0, 0), dtype=np.float32), meta)
+        vectors = _unit_rows(np.asarray([_as_vector(r["embedding"]) for r in rows], dtype=np.float32))
+
+        if len(rows) < ivf_min:
+            return cls(vectors, meta)
+
+        n_lists = int(np.sqrt(len(rows)))
+        centroids = _spherical_kmeans(vectors, n_lists, kmeans_iterations)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+        # Store vectors grouped by cluster so each list is one contiguous slice
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        return cls(vectors[order], [meta[i] for i in order], centroids, offsets)
+
+    @property
+    def nbytes(self) -> int:
+        size = self.vectors.nbytes + sum(len(m["content"] or "") for m in self.meta)
+        if self.centroids is not None:
+            size += self.centroids.nbytes + self.offsets.nbytes
+        return size
+
+    def search(self, query_embedding: List[float], top_k: int = 5, nprobe: int = 8) -> List[Dict]:
+        """Same result shape as the match_embeddings RPC"""
+        if not self.meta:
+            return []
+        query = _unit_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+
+        if self.centroids is None:
+            candidates = np.arange(len(self.meta))
+        else:
+            probes = np.argsort(-(self.centroids @ query))[:nprobe]
+            candidates = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return []
+        scores = self.vectors[candidates] @ query
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {**self.meta[candidates[i]], "similarity": float(scores[i])}
+            for i in best
+        ]
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5, nprobe: int = 8) -> List[List[Dict]]:
+        """search() for several queries; exact indexes score them in one matrix product"""
+        if self.centroids is not None:
+            return [self.search(q, top_k, nprobe) for q in query_embeddings]
+        if not self.meta:
+            return [[] for _ in query_embeddings]
+
+        queries = _unit_rows(np.asarray(query_embeddings, dtype=np.float32))
+        scores = queries @ self.vectors.T
+        k = min(top_k, len(self.meta))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in zip(scores, best):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([{**self.meta[i], "similarity": float(row[i])} for i in ranked])
+        return results
+
+    # 🔹 Persistence: .npy arrays are opened memory-mapped on load
+    def save(self, directory: Path, version: str):
+        tmp = directory.with_name(directory.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        np.save(tmp / "vectors.npy", self.vectors)
+        if self.centroids is not None:
+            np.save(tmp / "centroids.npy", self.centroids)
+            np.save(tmp / "offsets.npy", self.offsets)
+        (tmp / "meta.json").write_text(json.dumps(self.meta), encoding="utf-8")
+        (tmp / "version").write_text(version, encoding="utf-8")
+
+        shutil.rmtree(directory, ignore_errors=True)
+        tmp.rename(directory)
+
+    @classmethod
+    def load(cls, directory: Path, version: str) -> Optional["LocalVectorIndex"]:
+        """The saved index, unless it was built from another version of the embeddings"""
+        if not (directory / "meta.json").exists() or not (directory / "version").exists():
+            return None
+        if (directory / "version").read_text(encoding="utf-8") != version:
+            return None
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        centroids = offsets = None
+        if (directory / "centroids.npy").exists():
+            centroids = np.load(directory / "centroids.npy")
+            offsets = np.load(directory / "offsets.npy")
+        return cls(vectors, meta, centroids, offsets)
+
+
+class _CachedIndex:
+    __slots__ = ("index", "version", "checked_at")
+
+    def __init__(self, index: LocalVectorIndex, version: str):
+        self.index = index
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+class LocalIndexCache:
+    """
+    LRU of per-document indexes keyed by file_id, bounded by `max_bytes`.
+
+    Indexes are built lazily on the first query from the rows returned by
+    `loader`, and written to `index_dir` (when set) so a restarted process
+    maps them from disk instead of reloading every embedding.
+
+    Every index is tagged with the version of the embeddings it was built
+    from, as reported by the caller's `version` function. That function
+    returns None while the embeddings are being written, and no index is
+    used until they are final. A cached index is re-checked at most every
+    `revalidate_seconds`, so a re-ingest in another process is picked up
+    within that window.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = None,
+        index_dir: str = None,
+        nprobe: int = None,
+        ivf_min: int = None,
+        revalidate_seconds: float = None
+    ):
+        self.max_bytes = max_bytes or int(os.getenv("LOCAL_INDEX_MAX_BYTES", str(512 * 1024 * 1024)))
+        index_dir = index_dir if index_dir is not None else os.getenv("LOCAL_INDEX_DIR", "")
+        self.index_dir = Path(index_dir) if index_dir else None
+        self.nprobe = nprobe or int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+        self.ivf_min = ivf_min or int(os.getenv("LOCAL_INDEX_IVF_MIN", "4096"))
+        self.revalidate_seconds = revalidate_seconds if revalidate_seconds is not None \
+            else float(os.getenv("LOCAL_INDEX_REVALIDATE_SECONDS", "5"))
+
+        self._indexes: "OrderedDict[str, _CachedIndex]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # file_id -> [lock, threads using it]; dropped once no build needs it
+        self._build_locks: Dict[str, list] = {}
+        # Bumped by invalidate() while a build is in flight, so that build is not cached
+        self._generations: Dict[str, int] = {}
+
+        self.hits = 0
+        self.disk_loads = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def cached(self, file_id: str) -> Optional[LocalVectorIndex]:
+        """The cached index when its version was checked recently, without touching the database"""
+        with self._lock:
+            entry = self._indexes.get(file_id)
+            if entry is None or time.monotonic() - entry.checked_at > self.revalidate_seconds:
+                return None
+            self._indexes.move_to_end(file_id)
+            self.hits += 1
+            return entry.index
+
+    def get(
+        self,
+        file_id: str,
+        loader: Callable[[str], List[Dict]],
+        version: Callable[[str], Optional[str]]
+    ) -> Optional[LocalVectorIndex]:
+        """
+        The document's index at its current version, built or loaded when
+        needed. None while its embeddings are still being written; callers
+        then search the database instead.
+        """
+        index = self.cached(file_id)
+        if index is not None:
+            return index
+
+        current = version(file_id)
+        if current is None:
+            return None
+
+        with self._lock:
+            entry = self._indexes.get(file_id)
+            if entry is not None and entry.version == current:
+                entry.checked_at = time.monotonic()
+                self._indexes.move_to_end(file_id)
+                self.hits += 1
+                return entry.index
+
+        # One build per document even when several queries arrive at once
+        with self._lock:
+            build_lock = self._build_locks.setdefault(file_id, [threading.Lock(), 0])
+            build_lock[1] += 1
+        try:
+            with build_lock[0]:
+                return self._build(file_id, loader, current)
+        finally:
+            with self._lock:
+                build_lock[1] -= 1
+                if not build_lock[1]:
+                    del self._build_locks[file_id]
+                    self._generations.pop(file_id, None)
+
+    def _build(self, file_id: str, loader: Callable[[str], List[Dict]], current: str) -> LocalVectorIndex:
+        """Load or build the index at version `current`; called under the document's build lock"""
+        with self._lock:
+            entry = self._indexes.get(file_id)
+            if entry is not None and entry.version == current:
+                return entry.index
+            generation = self._generations.get(file_id, 0)
+
+        index = self._load(file_id, current)
+        built = index is None
+        if built:
+            index = LocalVectorIndex.build(loader(file_id), ivf_min=self.ivf_min)
+            self.builds += 1
+            logger.info(f"🧭 Built local index for {file_id}: {len(index.meta)} vectors")
+
+        # Embeddings changed while loading: answer this query, cache nothing
+        if not self._insert(file_id, _CachedIndex(index, current), generation):
+            return index
+        if built:
+            self._save(file_id, index, current)
+        return index
+
+    def invalidate(self, file_id: str):
+        """Drop a document's index, in memory and on disk, after its embeddings change"""
+        with self._lock:
+            if file_id in self._build_locks:
+                self._generations[file_id] = self._generations.get(file_id, 0) + 1
+            entry = self._indexes.pop(file_id, None)
+            if entry is not None:
+                self._bytes -= entry.index.nbytes
+        if self.index_dir:
+            shutil.rmtree(self.index_dir / file_id, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._indexes),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_loads": self.disk_loads,
+                "builds": self.builds,
+                "evictions": self.evictions
+            }
+
+    def _insert(self, file_id: str, entry: _CachedIndex, generation: int) -> bool:
+        """Cache an index unless the document was invalidated since `generation`"""
+        with self._lock:
+            if self._generations.get(file_id, 0) != generation:
+                return False
+            previous = self._indexes.pop(file_id, None)
+            if previous is not None:
+                self._bytes -= previous.index.nbytes
+            self._indexes[file_id] = entry
+            self._bytes += entry.index.nbytes
+
+            # Always keep the newest index, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._indexes) > 1:
+                _, evicted = self._indexes.popitem(last=False)
+                self._bytes -= evicted.index.nbytes
+                self.evictions += 1
+            return True
+
+    def _load(self, file_id: str, version: str) -> Optional[LocalVectorIndex]:
+        if not self.index_dir:
+            return None
+        try:
+            index = LocalVectorIndex.load(self.index_dir / file_id, version)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load local index for {file_id}: {e}")
+            return None
+        if index is not None:
+            self.disk_loads += 1
+        return index
+
+    def _save(self, file_id: str, index: LocalVectorIndex, version: str):
+        if not self.index_dir:
+            return
+        try:
+            index.save(self.index_dir / file_id, version)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist local index for {file_id}: {e}")
+
+
+def _as_vector(embedding) -> List[float]:
+    # pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings
+    return json.loads(embedding) if isinstance(embedding, str) else embedding
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _spherical_kmeans(vectors: np.ndarray, k: int, iterations: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _unit_rows(centroids)
+    return centroids
+
+
+_shared_cache: Optional[LocalIndexCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_local_index_cache() -> LocalIndexCache:
+    """Process-wide local index cache"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LocalIndexCache()
+        return _shared_cache
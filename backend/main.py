@@ -1,21 +1,44 @@
 import asyncio
-import traceback
-from io import BytesIO
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from pypdf import PdfReader
 import pycountry
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from typing import Dict
+from supabase import Client
+from typing import Dict, List, Optional
 from langdetect import detect
 
+from answer_cache import get_answer_cache
+from clients import EMBEDDING_MODEL, get_supabase
+from context_builder import get_token_counter
 from document_processor import DocumentProcessor
-from qa_chain import QAChain
+from embedding_cache import get_embedding_cache
+from ingest_queue import IngestQueue, IngestQueueFull
+from job_store import JobStore
+from local_index import get_local_index_cache
+from metrics import (
+    ENABLED as METRICS_ENABLED, HTTP_REQUEST_SECONDS, INGEST_CHUNKS, INGEST_DOCUMENTS, INGEST_PAGES,
+    INGEST_STAGE_SECONDS, register_collector, render as render_metrics, timed_iter
+)
+from page_extractor import shutdown_extract_pool
+from progress_bus import ProgressBus
+from qa_chain import QA_MODEL, QAChain
+from summarizer import get_summary_cache
+from upload_spool import (
+    MAX_UPLOAD_BYTES, FormSpooler, InvalidUpload, UploadTooLarge, discard as discard_spool, sweep_stale
+)
 from vector_store import VectorStore
 
-import tempfile
 import os
 from pathlib import Path
 import shutil
@@ -23,15 +46,92 @@ from typing import Dict
 from dotenv import load_dotenv
 
 load_dotenv()
-app = FastAPI()
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# ------------------------
+# Ingest worker pool
+# ------------------------
+ingest_queue = IngestQueue()
+
+# ------------------------
+# Uploads
+# ------------------------
+# Multipart boundaries, part headers and the file_id field around the PDF
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "200"))
+# Whole /upload-pdfs request; each PDF in it is still held to MAX_UPLOAD_BYTES
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_MB", "2048")) * 1024 * 1024
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(sweep_stale)
+    # Load the tokenizer now rather than inside the first question
+    await run_in_threadpool(get_token_counter, QA_MODEL)
+    recovery_task = asyncio.create_task(recover_jobs_periodically())
+    yield
+    recovery_task.cancel()
+    ingest_queue.shutdown(wait=False)
+    shutdown_extract_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    if not METRICS_ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates ("/processing-status/{document_id}") keep label values bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start, method=request.method, route=route, status=response.status_code
+    )
+    return response
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request, call_next):
+    # Refuse from the declared length before any of the body is read; bodies
+    # sent without one are counted as they stream in (receive_form)
+    limits = {
+        "/upload-pdf": (MAX_UPLOAD_BYTES, "PDF"),
+        "/upload-pdfs": (MAX_BATCH_UPLOAD_BYTES, "Batch")
+    }
+    if request.method == "POST" and request.url.path in limits:
+        limit, what = limits[request.url.path]
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > limit + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse({"detail": f"{what} exceeds {limit // (1024 * 1024)} MB"}, status_code=413)
+    return await call_next(request)
 
 # ------------------------
 # Supabase client
 # ------------------------
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-)
+supabase: Client = get_supabase()
+
+# ------------------------
+# Durable ingest jobs
+# ------------------------
+job_store = JobStore(supabase)
+_scheduled_jobs = set()
+# Set when a job was left in the table for lack of a queue slot; the next
+# finished job then refills the queue instead of waiting for the sweep
+_backlog = threading.Event()
+
+# ------------------------
+# Processing progress
+# ------------------------
+# Live status of documents ingesting here; the files row is written less often
+progress_bus = ProgressBus(supabase)
 
 # ------------------------
 # CORS
@@ -50,8 +150,48 @@ app.add_middleware(
 # ------------------------
 # QA sessions
 # ------------------------
+# Long-lived per-document sessions; the clients inside are shared anyway,
+# so this only bounds how much document-scoped state is kept around.
+_qa_sessions: "OrderedDict[str, QAChain]" = OrderedDict()
+_qa_sessions_lock = threading.Lock()
+QA_SESSION_CACHE_SIZE = int(os.getenv("QA_SESSION_CACHE_SIZE", "256"))
+
+# Documents being ingested here that can already be queried: document id ->
+# last page whose chunks are all stored
+_partial_documents: Dict[str, int] = {}
+
+
+def _cached_qa_chain(document_id: str) -> QAChain:
+    with _qa_sessions_lock:
+        qa = _qa_sessions.get(document_id)
+        if qa:
+            _qa_sessions.move_to_end(document_id)
+        return qa
+
+
 def get_qa_chain(document_id: str) -> QAChain:
-    return QAChain(document_id)
+    qa = _cached_qa_chain(document_id)
+    if qa:
+        return qa
+
+    qa = QAChain(document_id)
+
+    with _qa_sessions_lock:
+        _qa_sessions[document_id] = qa
+        while len(_qa_sessions) > QA_SESSION_CACHE_SIZE:
+            _qa_sessions.popitem(last=False)
+    return qa
+
+
+async def aget_qa_chain(document_id: str) -> QAChain:
+    # Only a new session touches the database, so only then leave the event loop
+    return _cached_qa_chain(document_id) or await run_in_threadpool(get_qa_chain, document_id)
+
+
+def drop_qa_session(document_id: str):
+    """Forget a session whose index changed; the next question resolves it again"""
+    with _qa_sessions_lock:
+        _qa_sessions.pop(document_id, None)
 
 
 # ------------------------
@@ -74,124 +214,448 @@ def get_language_name(code: str) -> str:
         return "Unknown"
 
 
+def link_existing_index(document_id: str, content_hash: str) -> bool:
+    """
+    Point a new upload at the chunks of an identical PDF that is already
+    processed. Returns False (after recording the hash) when there is none.
+    """
+    result = supabase.table("files")\
+        .select("id, index_file_id, pages, language, word_count, processing_status")\
+        .eq("content_hash", content_hash)\
+        .neq("id", document_id)\
+        .eq("processing_status->>ai_ready", "true")\
+        .limit(1)\
+        .execute()
+
+    if not result.data:
+        supabase.table("files").update({
+            "content_hash": content_hash
+        }).eq("id", document_id).execute()
+        return False
+
+    source = result.data[0]
+    index_file_id = source.get("index_file_id") or source["id"]
+    supabase.table("files").update({
+        "content_hash": content_hash,
+        "index_file_id": index_file_id,
+        "pages": source.get("pages"),
+        "language": source.get("language"),
+        "word_count": source.get("word_count"),
+        "processing_status": source["processing_status"]
+    }).eq("id", document_id).execute()
+    # A session opened before the link still points at the empty index
+    drop_qa_session(document_id)
+
+    logger.info(f"♻️ Identical PDF already indexed, {document_id} reuses {index_file_id}")
+    return True
+
+
 # =========================================================
-# 🔥 Background PDF processing
+# 🗂️ Ingest job lifecycle
 # =========================================================
-async def process_pdf_background(file_name: str, document_id: str):
+def schedule_job(job: Dict, local_path: str = None) -> bool:
+    """
+    Hand a persisted job to the worker pool; False if the pool is full.
+    `local_path` is a spooled copy of the upload that the job then owns;
+    it is removed whenever the job does not take it.
+    """
+    if job["id"] in _scheduled_jobs:
+        discard_spool(local_path)
+        return True
+
+    _scheduled_jobs.add(job["id"])
+    try:
+        ingest_queue.submit(
+            run_ingest_job, job, local_path,
+            tenant=job.get("tenant_id") or "",
+            size=job.get("size_bytes") or 0
+        )
+        return True
+    except IngestQueueFull:
+        _scheduled_jobs.discard(job["id"])
+        discard_spool(local_path)
+        _backlog.set()
+        return False
+
+
+def run_ingest_job(job: Dict, local_path: str = None):
+    try:
+        claimed = job_store.claim(job)
+        if not claimed:
+            return
+
+        try:
+            with job_store.keep_alive(claimed["id"]):
+                process_pdf_background(
+                    claimed["file_name"], claimed["file_id"],
+                    final_attempt=job_store.is_last_attempt(claimed), local_path=local_path
+                )
+        except Exception as e:
+            job_store.release(claimed, str(e))
+            return
+
+        job_store.complete(claimed["id"])
+    finally:
+        _scheduled_jobs.discard(job["id"])
+        # Retries run from the recovery sweep and read the PDF from storage
+        discard_spool(local_path)
+
+    if _backlog.is_set():
+        _backlog.clear()
+        try:
+            recover_jobs()
+        except Exception as e:
+            logger.error(f"❌ Refilling the ingest queue failed: {e}")
+
+
+def recover_jobs():
+    """Schedule queued jobs and jobs abandoned by a dead worker"""
+    for job in job_store.recoverable():
+        # A tenant at its share skips only its own jobs
+        if ingest_queue.full():
+            _backlog.set()
+            break
+        schedule_job(job)
+
+
+async def recover_jobs_periodically():
+    interval = int(os.getenv("INGEST_RECOVERY_INTERVAL", "60"))
+    while True:
+        try:
+            await run_in_threadpool(recover_jobs)
+        except Exception as e:
+            logger.error(f"❌ Job recovery failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# =========================================================
+# 🔥 Background PDF processing (runs on the ingest worker pool)
+# =========================================================
+def process_pdf_background(file_name: str, document_id: str, final_attempt: bool = True, local_path: str = None):
+    """
+    Ingest one PDF. `local_path` is the spooled upload, read memory-mapped;
+    without it (recovered and retried jobs) the PDF is downloaded from storage.
+    Unless this is the `final_attempt`, a failure leaves the document
+    processing, for the retry, instead of reporting an error.
+    """
     processing_status = {
         "text_extraction": False,
         "vector_embedding": False,
         "ai_ready": False,
         "current_chunk": 0,
         "total_chunks": 0,
+        "total_pages": 0,
+        "partially_ready": False,
+        "indexed_through_page": 0,
         "error": None
     }
+    started = time.perf_counter()
+    # Extraction and chunking interleave with embedding, so their time is summed
+    stage_seconds = {}
 
     try:
-        # ===== Download PDF bytes from Supabase =====
-        res = supabase.storage.from_("pdfs").download(file_name)
-        if res is None:
-            raise ValueError("PDF not found in Supabase bucket")
-        pdf_bytes = res
-
-        # ===== Text extraction =====
-        reader = PdfReader(BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
-        full_text = "".join(page.extract_text() or "" for page in reader.pages)
-        total_words = len(full_text.split())
+        # ===== Checkpoint from a previous attempt =====
+        previous = supabase.table("files")\
+            .select("processing_status")\
+            .eq("id", document_id)\
+            .execute()
+        checkpoint = (previous.data[0].get("processing_status") if previous.data else None) or {}
+        processing_status["current_chunk"] = checkpoint.get("current_chunk") or 0
+        processing_status["total_chunks"] = checkpoint.get("total_chunks") or 0
+
+        # ===== PDF source: the spooled upload, else download from Supabase =====
+        if local_path and os.path.exists(local_path):
+            pdf_source = local_path
+        else:
+            with INGEST_STAGE_SECONDS.time(stage="download"):
+                res = supabase.storage.from_("pdfs").download(file_name)
+            if res is None:
+                raise ValueError("PDF not found in Supabase bucket")
+            pdf_source = res
+
+        # ===== Streaming pipeline: pages -> chunks -> embeddings =====
+        # Pages are parsed, chunked and embedded as they arrive, so the first
+        # pages are searchable long before the last ones are parsed.
+        processor = DocumentProcessor()
+        total_pages = processor.count_pages(pdf_source)
+        processing_status["total_pages"] = total_pages
+
+        # Chunking is deterministic, so chunks below the checkpoint are already stored
+        resume_from = 0
+        if checkpoint.get("total_pages") == total_pages:
+            resume_from = checkpoint.get("current_chunk") or 0
+            if resume_from:
+                logger.info(f"⏩ Resuming from chunk {resume_from}")
+        processing_status["current_chunk"] = resume_from
+        if resume_from and checkpoint.get("partially_ready"):
+            # The stored pages stay queryable while the rest is redone
+            processing_status["partially_ready"] = True
+            processing_status["indexed_through_page"] = checkpoint.get("indexed_through_page") or 0
+            _partial_documents[document_id] = processing_status["indexed_through_page"]
+
+        progress_bus.publish(document_id, processing_status, {"pages": total_pages}, persist=True)
+
+        pages_read = 0
+        total_words = 0
+        language_sample = []
+
+        def pages():
+            nonlocal pages_read, total_words
+            for text in timed_iter(processor.iter_pages(pdf_source), stage_seconds, "extract"):
+                pages_read += 1
+                total_words += len(text.split())
+                if len(language_sample) < 3:
+                    language_sample.append(text)
+                yield text
+
+        # Every chunk, in order: page of each chunk and input for the lexical index
+        all_chunks = []
+
+        def chunks():
+            for idx, doc in enumerate(timed_iter(processor.iter_chunks(pages()), stage_seconds, "extract_and_chunk")):
+                chunk = {
+                    "chunk_id": idx,
+                    "page": doc.metadata.get("page", 0),
+                    "text": doc.page_content
+                }
+                all_chunks.append(chunk)
+                if idx >= resume_from:
+                    yield chunk
+
+        def on_batch_stored(stored: int):
+            done = resume_from + stored
+            processing_status["current_chunk"] = done
+            # Estimated from the pages parsed so far until chunking finishes
+            processing_status["total_chunks"] = max(
+                done, round(len(all_chunks) * total_pages / max(pages_read, 1))
+            )
+
+            # Pages whose chunks are all stored; the next chunk, if already
+            # produced, tells whether the last stored page is complete
+            last_page = all_chunks[done - 1]["page"]
+            if done < len(all_chunks) and all_chunks[done]["page"] == last_page:
+                last_page -= 1
+            first_partial = last_page > 0 and not processing_status["partially_ready"]
+            if last_page > 0:
+                processing_status["partially_ready"] = True
+                processing_status["indexed_through_page"] = last_page
+                _partial_documents[document_id] = last_page
+                # Answers given so far only saw the earlier pages
+                get_answer_cache().invalidate(document_id)
+
+            # Other processes only need to learn when the document becomes queryable
+            progress_bus.publish(document_id, processing_status, persist=first_partial)
+
+        vector_store = VectorStore()
+        with INGEST_STAGE_SECONDS.time(stage="pipeline"):
+            vector_store.store_chunks(document_id, chunks(), on_batch_stored=on_batch_stored)
+
+        INGEST_STAGE_SECONDS.observe(stage_seconds.get("extract", 0.0), stage="extract")
+        INGEST_STAGE_SECONDS.observe(
+            stage_seconds.get("extract_and_chunk", 0.0) - stage_seconds.get("extract", 0.0), stage="chunk"
+        )
+        INGEST_PAGES.inc(pages_read)
+        INGEST_CHUNKS.inc(max(0, len(all_chunks) - resume_from))
+
+        if not all_chunks:
+            raise ValueError("No readable text in PDF")
 
         try:
-            sample = "".join(page.extract_text() or "" for page in reader.pages[:3])
+            sample = "".join(language_sample)
             language = get_language_name(detect(sample)) if sample.strip() else "Unknown"
         except:
             language = "Unknown"
 
         processing_status["text_extraction"] = True
-        supabase.table("files").update({
-            "pages": total_pages,
+        processing_status["total_chunks"] = len(all_chunks)
+        processing_status["current_chunk"] = len(all_chunks)
+        progress_bus.publish(document_id, processing_status, {
             "language": language,
-            "word_count": total_words,
-            "processing_status": processing_status
-        }).eq("id", document_id).execute()
-
-        # ===== Chunking =====
-        processor = DocumentProcessor()
-
-        # Windows-safe temp file
-        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-        try:
-            tmp.write(pdf_bytes)
-            tmp.close()
-            documents = processor.process(tmp.name)
-        finally:
-            os.remove(tmp.name)
-
-        if not documents:
-            raise ValueError("No readable text in PDF")
+            "word_count": total_words
+        }, persist=True)
 
-        processing_status["total_chunks"] = len(documents)
-
-        # ===== Embeddings =====
-        vector_store = VectorStore()
-        batch = []
-        for idx, doc in enumerate(documents):
-            batch.append({
-                "chunk_id": idx,
-                "page": doc.metadata.get("page", 0),
-                "text": doc.page_content
-            })
-
-            if len(batch) == 20:
-                vector_store.store_chunks_batch(document_id, batch)
-                batch = []
-                processing_status["current_chunk"] = idx
-                supabase.table("files").update({
-                    "processing_status": processing_status
-                }).eq("id", document_id).execute()
-
-        if batch:
-            vector_store.store_chunks_batch(document_id, batch)
+        # BM25 index over every chunk, for hybrid retrieval
+        with INGEST_STAGE_SECONDS.time(stage="lexical_index"):
+            vector_store.store_lexical_index(document_id, all_chunks)
 
         processing_status["vector_embedding"] = True
+        # Cached answers were built from the previous embeddings
+        get_answer_cache().invalidate(document_id)
 
         # ===== QA ready =====
 
         processing_status["ai_ready"] = True
-        supabase.table("files").update({
-            "processing_status": processing_status
-        }).eq("id", document_id).execute()
+        # Version of the finished embeddings; local indexes are keyed by it
+        processing_status["indexed_at"] = datetime.now(timezone.utc).isoformat()
+        processing_status["partially_ready"] = False
+        processing_status["indexed_through_page"] = total_pages
+        progress_bus.publish(document_id, processing_status, {
+            # Any stored summary described the previous embeddings
+            "summary": None,
+            "summary_version": None
+        }, persist=True)
+        drop_qa_session(document_id)
+
+        logger.info("✅ PDF processing complete!")
+
+        # ===== Summary (precomputed, served as a plain read) =====
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="summary"):
+                get_qa_chain(document_id).precompute_summary()
+            logger.info("✅ Summary precomputed")
+        except Exception as e:
+            logger.warning(f"⚠️ Summary precompute failed, it will be built on demand: {e}")
 
-        print("✅ PDF processing complete!")
+        INGEST_DOCUMENTS.inc(result="ok")
 
     except Exception as e:
+        INGEST_DOCUMENTS.inc(result="error")
         error_msg = str(e)
-        print(f"❌ Processing failed: {error_msg}")
-        traceback.print_exc()
-        processing_status["error"] = error_msg
+        logger.exception(f"❌ Processing failed: {error_msg}")
         processing_status["ai_ready"] = False
-        supabase.table("files").update({
-            "processing_status": processing_status
-        }).eq("id", document_id).execute()
+        if final_attempt:
+            processing_status["error"] = error_msg
+        else:
+            # Clients treat `error` as final; this attempt will be retried
+            processing_status["retrying"] = True
+            processing_status["last_error"] = error_msg
+        progress_bus.publish(document_id, processing_status, persist=True)
+        raise
+    finally:
+        INGEST_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+        _partial_documents.pop(document_id, None)
+        progress_bus.finish(document_id)
 
 
 # =========================================================
-# 📤 Upload PDF endpoint
+# 📤 Upload PDF endpoints
 # =========================================================
+def file_tenants(file_ids: List[str]) -> Dict[str, str]:
+    """Owner of each file; ingest is shared fairly between owners"""
+    result = supabase.table("files").select("id, user_id").in_("id", file_ids).execute()
+    return {row["id"]: row.get("user_id") for row in result.data or []}
+
+
+async def receive_form(request: Request, max_total_bytes: int) -> FormSpooler:
+    """
+    Stream a multipart upload straight into spool files. Each PDF is written
+    once, and the request is refused with 413 as soon as a PDF passes
+    MAX_UPLOAD_BYTES or the body passes `max_total_bytes`.
+    """
+    try:
+        form = FormSpooler(request.headers.get("content-type"), MAX_UPLOAD_BYTES, max_total_bytes)
+    except InvalidUpload as e:
+        raise HTTPException(400, str(e))
+
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(form.feed, chunk)
+        form.finish()
+    except BaseException as e:
+        form.discard()
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(413, str(e))
+        if isinstance(e, InvalidUpload):
+            raise HTTPException(400, str(e))
+        raise
+    return form
+
+
 @app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), file_id: str = Form(...)):
-    if file.content_type != "application/pdf":
-        raise HTTPException(400, "Only PDFs allowed")
+async def upload_pdf(request: Request):
+    """Multipart form with one PDF as `file` and its `file_id`"""
+    form = await receive_form(request, MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD)
+    try:
+        files, file_ids = form.files.get("file", []), form.fields.get("file_id", [])
+        if len(files) != 1 or len(file_ids) != 1:
+            raise HTTPException(400, "Send one PDF as `file` with its `file_id`")
+
+        tenants = await run_in_threadpool(file_tenants, file_ids)
+    except BaseException:
+        form.discard()
+        raise
+    return await accept_upload(files[0], file_ids[0], tenants.get(file_ids[0]))
+
+
+@app.post("/upload-pdfs")
+async def upload_pdfs(request: Request):
+    """
+    Bulk upload: PDFs as `files`, with one `file_ids` field per PDF, in order.
+    Every PDF gets its own ingest job, queued fairly against other users'
+    uploads; follow them together at /batches/{batch_id}.
+    """
+    form = await receive_form(request, MAX_BATCH_UPLOAD_BYTES)
+    try:
+        files, file_ids = form.files.get("files", []), form.fields.get("file_ids", [])
+        if not files or len(files) != len(file_ids):
+            raise HTTPException(400, "Send one file_id per file")
+        if len(files) > MAX_BATCH_FILES:
+            raise HTTPException(413, f"At most {MAX_BATCH_FILES} PDFs per batch")
+
+        batch_id = str(uuid.uuid4())
+        tenants = await run_in_threadpool(file_tenants, file_ids)
+    except BaseException:
+        form.discard()
+        raise
+
+    # Storage uploads and dedup lookups overlap a few at a time; the ingest
+    # queue, not this endpoint, decides when each document is processed
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+
+    async def accept(file: Dict, file_id: str) -> Dict:
+        async with semaphore:
+            try:
+                return await accept_upload(file, file_id, tenants.get(file_id))
+            except HTTPException as e:
+                return {"document_id": file_id, "error": e.detail}
+            except Exception as e:
+                logger.exception(f"❌ Batch upload of {file_id} failed: {e}")
+                return {"document_id": file_id, "error": "Upload failed"}
+
+    documents = await asyncio.gather(*(accept(f, i) for f, i in zip(files, file_ids)))
+
+    accepted = [d["document_id"] for d in documents if "error" not in d]
+    if accepted:
+        await run_in_threadpool(
+            lambda: supabase.table("files").update({"batch_id": batch_id}).in_("id", accepted).execute()
+        )
+    logger.info(f"📦 Batch {batch_id}: {len(accepted)}/{len(documents)} PDFs accepted")
+
+    return {"batch_id": batch_id if accepted else None, "documents": documents}
+
+
+async def accept_upload(file: Dict, file_id: str, tenant_id: Optional[str]) -> Dict:
+    """Dedupe, store and schedule one spooled PDF; its spool file is taken over"""
+    local_path, content_hash, size = file["path"], file["sha256"], file["size"]
+    file_name = f"{file_id}_{file['filename']}"
 
-    pdf_bytes = await file.read()
-    file_name = f"{file_id}_{file.filename}"
+    try:
+        # Identical bytes were already processed: reuse their chunks and embeddings
+        if await run_in_threadpool(link_existing_index, file_id, content_hash):
+            discard_spool(local_path)
+            return {"document_id": file_id, "message": "Reused existing index"}
+
+        # Stream the spooled PDF to Supabase Storage
+        await run_in_threadpool(_upload_to_storage, file_name, local_path)
+
+        # Persist the job, then start background processing on the spooled copy
+        job = await run_in_threadpool(job_store.enqueue, file_id, file_name, tenant_id, size)
+    except BaseException:
+        discard_spool(local_path)
+        raise
+
+    # A full pool is not an error: the job is stored and the sweep schedules it
+    scheduled = schedule_job(job, local_path)
+    if not scheduled:
+        logger.info(f"⏳ Ingest pool busy, job {job['id']} left for the recovery sweep")
 
-    # Upload PDF to Supabase Storage
-    supabase.storage.from_("pdfs").upload(file_name, pdf_bytes, {"cacheControl": "3600"})
+    logger.info(f"📥 Spooled {size / (1024 * 1024):.1f} MB upload for {file_id}")
+    return {"document_id": file_id, "message": "Processing started" if scheduled else "Queued for processing"}
 
-    # Start background processing
-    asyncio.create_task(process_pdf_background(file_name, file_id))
 
-    return {"document_id": file_id, "message": "Processing started"}
+def _upload_to_storage(file_name: str, local_path: str):
+    with open(local_path, "rb") as f:
+        supabase.storage.from_("pdfs").upload(file_name, f, {"cacheControl": "3600"})
 
 
 # =========================================================
@@ -200,23 +664,214 @@ async def upload_pdf(file: UploadFile = File(...), file_id: str = Form(...)):
 @app.post("/ask-question")
 async def ask_question(req: QuestionRequest):
     try:
-        qa = get_qa_chain(req.document_id)
-        return qa.ask(req.question)
+        qa = await aget_qa_chain(req.document_id)
+        result = await qa.aask(req.question)
+        if req.document_id in _partial_documents:
+            # Still ingesting: the answer only covers the pages indexed so far
+            result["indexed_through_page"] = _partial_documents[req.document_id]
+        return result
+    except Exception as e:
+        logger.exception(f"❌ Failed to answer question on {req.document_id}: {e}")
+        raise HTTPException(500, "Failed to get answer")
+
+
+@app.post("/ask-question/stream")
+async def ask_question_stream(req: QuestionRequest):
+    """Server-sent events: `token` events as the answer is generated, then `done` with the pages used"""
+    try:
+        qa = await aget_qa_chain(req.document_id)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception(f"❌ Failed to answer question on {req.document_id}: {e}")
         raise HTTPException(500, "Failed to get answer")
 
+    async def events():
+        async for event in qa.astream_ask(req.question):
+            if event["type"] == "done" and req.document_id in _partial_documents:
+                event["indexed_through_page"] = _partial_documents[req.document_id]
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 
 # =========================================================
 # 🔍 Processing status endpoint
 # =========================================================
+PROCESSING_STATUS_COLUMNS = "id, pages, language, word_count, processing_status"
+
+
+def _stored_status(document_id: str):
+    result = supabase.table("files").select(PROCESSING_STATUS_COLUMNS).eq("id", document_id).execute()
+    return result.data[0] if result.data else None
+
+
 @app.get("/processing-status/{document_id}")
 def processing_status(document_id: str):
-    result = supabase.table("files").select("*").eq("id", document_id).execute()
-    if not result.data:
+    # Documents ingesting in this process are answered from memory
+    status = progress_bus.snapshot(document_id) or _stored_status(document_id)
+    if not status:
         raise HTTPException(404, "Document not found")
-    return result.data[0]
+    return status
+
+
+@app.get("/batches/{batch_id}")
+def batch_status(batch_id: str):
+    """Progress of a bulk upload: per-document state and the batch as a whole"""
+    files = supabase.table("files")\
+        .select("id, file_name, pages, processing_status")\
+        .eq("batch_id", batch_id)\
+        .execute().data
+    if not files:
+        raise HTTPException(404, "Batch not found")
+
+    jobs = supabase.table("ingest_jobs")\
+        .select("file_id, status, error")\
+        .in_("file_id", [f["id"] for f in files])\
+        .execute().data or []
+    jobs = {job["file_id"]: job for job in jobs}
+
+    counts = {"queued": 0, "processing": 0, "ready": 0, "failed": 0}
+    done = 0.0
+    documents = []
+    for row in files:
+        status = (progress_bus.snapshot(row["id"]) or row).get("processing_status") or {}
+        job = jobs.get(row["id"]) or {}
+
+        # Reused indexes have no job; failed attempts are retried until the job fails
+        if job.get("status") == "failed":
+            state, fraction = "failed", 1.0
+        elif status.get("ai_ready"):
+            state, fraction = "ready", 1.0
+        elif job.get("status") == "running" or status.get("total_pages"):
+            state = "processing"
+            fraction = status.get("current_chunk", 0) / status["total_chunks"] if status.get("total_chunks") else 0.0
+        else:
+            state, fraction = "queued", 0.0
+
+        counts[state] += 1
+        done += fraction
+        documents.append({
+            "document_id": row["id"],
+            "file_name": row.get("file_name"),
+            "state": state,
+            "pages": row.get("pages"),
+            "current_chunk": status.get("current_chunk", 0),
+            "total_chunks": status.get("total_chunks", 0),
+            # Queued documents may carry the error of an attempt that will be retried
+            "error": None if state == "ready" else job.get("error") or status.get("error")
+        })
+
+    return {
+        "batch_id": batch_id,
+        "documents": len(documents),
+        **counts,
+        "progress": round(done / len(documents), 4),
+        "complete": counts["queued"] + counts["processing"] == 0,
+        "items": documents
+    }
+
+
+@app.get("/processing-status/{document_id}/stream")
+async def processing_status_stream(document_id: str):
+    """Server-sent `progress` events as the document is processed, until it is ready or fails"""
+    async def events():
+        while True:
+            async for update in progress_bus.subscribe(document_id):
+                yield f"event: progress\ndata: {json.dumps(update)}\n\n"
+
+            # Not ingesting here (another process, queued, or just finished):
+            # the database has the latest persisted status
+            status = await run_in_threadpool(_stored_status, document_id)
+            if not status:
+                yield f"event: error\ndata: {json.dumps({'error': 'Document not found'})}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+
+            state = status.get("processing_status") or {}
+            if state.get("ai_ready") or state.get("error"):
+                return
+            await asyncio.sleep(progress_bus.persist_interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# =========================================================
+# 🧵 Ingest queue stats endpoint
+# =========================================================
+@app.get("/ingest-stats")
+def ingest_stats():
+    return {
+        **ingest_queue.stats(),
+        "progress": progress_bus.stats(),
+        "embedding_cache": get_embedding_cache(supabase, EMBEDDING_MODEL).stats()
+    }
+
+# =========================================================
+# 📈 Prometheus metrics endpoint
+# =========================================================
+def _collect_runtime_metrics():
+    """Cache and queue counters the components already keep, read at scrape time"""
+    answers = get_answer_cache().stats()
+    embeddings = get_embedding_cache(supabase, EMBEDDING_MODEL).stats()
+    summaries = get_summary_cache(supabase).stats()
+    local = get_local_index_cache().stats()
+    queue = ingest_queue.stats()
+
+    yield "cache_lookups_total", "counter", "Cache lookups by cache and result", [
+        ({"cache": "answer", "result": "exact_hit"}, answers["exact_hits"]),
+        ({"cache": "answer", "result": "semantic_hit"}, answers["semantic_hits"]),
+        ({"cache": "answer", "result": "miss"}, answers["misses"]),
+        ({"cache": "embedding", "result": "local_hit"}, embeddings["local_hits"]),
+        ({"cache": "embedding", "result": "store_hit"}, embeddings["store_hits"]),
+        ({"cache": "embedding", "result": "miss"}, embeddings["misses"]),
+        ({"cache": "summary", "result": "hit"}, summaries["hits"]),
+        ({"cache": "summary", "result": "miss"}, summaries["misses"]),
+        ({"cache": "local_index", "result": "hit"}, local["hits"]),
+        ({"cache": "local_index", "result": "disk_load"}, local["disk_loads"]),
+        ({"cache": "local_index", "result": "build"}, local["builds"])
+    ]
+    yield "cache_entries", "gauge", "Entries held in memory by each cache", [
+        ({"cache": "answer"}, answers["entries"]),
+        ({"cache": "embedding"}, embeddings["entries"]),
+        ({"cache": "summary"}, summaries["entries"]),
+        ({"cache": "local_index"}, local["documents"])
+    ]
+    yield "ingest_queue_jobs", "gauge", "Ingest jobs waiting and running in this process", [
+        ({"state": "queued"}, queue["queue_depth"]),
+        ({"state": "running"}, queue["in_flight"])
+    ]
+
+
+register_collector(_collect_runtime_metrics)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        raise HTTPException(404, "Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# =========================================================
+# ⚡ Cache stats endpoint
+# =========================================================
+@app.get("/cache-stats")
+def cache_stats():
+    return {
+        "answer_cache": get_answer_cache().stats(),
+        "embedding_cache": get_embedding_cache(supabase, EMBEDDING_MODEL).stats(),
+        "summary_cache": get_summary_cache(supabase).stats(),
+        "local_index": get_local_index_cache().stats()
+    }
+
 # ------------------------Summary-----------
 
 @app.post("/generate-summary")
@@ -227,12 +882,12 @@ async def generate_summary(payload: dict):
         raise HTTPException(400, "document_id is required")
 
     try:
-        qa = get_qa_chain(document_id)
-        summary = qa.generate_summary()
+        qa = await aget_qa_chain(document_id)
+        summary = await qa.agenerate_summary()
         return summary
 
     except Exception as e:
-        traceback.print_exc()
+        logger.exception(f"❌ Failed to generate summary for {document_id}: {e}")
         raise HTTPException(500, "Failed to generate summary")
 
 
@@ -0,0 +1,240 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Process-wide counters and latency histograms, rendered in the Prometheus
+# text format by GET /metrics. Every API worker process keeps its own
+# registry, so scrape each worker (or run a single worker per container).
+#
+# With METRICS_ENABLED=false, inc()/observe() return at once and time()
+# hands out a shared no-op context manager.
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Seconds; from a cache lookup up to a long summary or ingest stage
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# (name, type, help, [(labels, value)]) produced at scrape time
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels):
+        """Context manager that observes the duration of its block"""
+        if not ENABLED:
+            return _NOOP_TIMER
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start", "seconds")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "⏱️ %s %s %.3fs", self.histogram.name, self.labels, self.seconds,
+                extra={"metric": self.histogram.name, "labels": self.labels, "seconds": self.seconds}
+            )
+        return False
+
+
+class _NoopTimer:
+    seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def timed_iter(iterable: Iterable, totals: Dict[str, float], key: str):
+    """Yield from `iterable`, adding the time spent producing items to totals[key]"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            totals[key] = totals.get(key, 0.0) + time.perf_counter() - start
+            return
+        totals[key] = totals.get(key, 0.0) + time.perf_counter() - start
+        yield item
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]):
+    """Add samples computed at scrape time, e.g. from existing stats() methods"""
+    with _registry_lock:
+        _collectors.append(collector)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics, collectors = list(_registry), list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+
+    for collector in collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            logger.warning("⚠️ Metrics collector failed: %s", e)
+            continue
+        for name, kind, help, values in samples:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_number(value)}" if label_text else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
+
+
+# =========================================================
+# 📊 Metrics
+# =========================================================
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API latency by route, until the response starts (streams are measured to their first byte)",
+    ["method", "route", "status"]
+)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "pdf_ingest_stage_seconds",
+    "Time per document spent in each ingest stage (extract and chunk are summed over the streaming pipeline)",
+    ["stage"]
+)
+INGEST_PAGES = Counter("pdf_ingest_pages_total", "Pages extracted by ingest jobs")
+INGEST_CHUNKS = Counter("pdf_ingest_chunks_total", "Chunks embedded and stored by ingest jobs")
+INGEST_DOCUMENTS = Counter("pdf_ingest_documents_total", "Finished ingest jobs", ["result"])
+INGEST_QUEUE_SECONDS = Histogram("pdf_ingest_queue_seconds", "Time ingest jobs wait for a worker")
+
+EMBEDDING_REQUEST_SECONDS = Histogram("embedding_request_seconds", "Latency of embedding API requests", ["kind"])
+EMBEDDING_TEXTS = Counter("embedding_texts_total", "Texts sent to the embedding API", ["kind"])
+EMBEDDING_RETRIES = Counter("embedding_retries_total", "Embedding requests retried or split", ["reason"])
+DB_WRITE_SECONDS = Histogram("db_write_seconds", "Latency of chunk upserts into Supabase", ["table"])
+
+VECTOR_SEARCH_SECONDS = Histogram("vector_search_seconds", "Latency of similarity search", ["backend", "mode"])
+
+QA_STAGE_SECONDS = Histogram("qa_stage_seconds", "Time spent in each stage of answering a question", ["stage"])
+QA_REQUESTS = Counter("qa_requests_total", "Questions answered, by outcome", ["result"])
+QA_CONTEXT_TOKENS = Counter("qa_context_tokens_total", "Tokens of retrieved context sent with questions")
+
+SUMMARY_STAGE_SECONDS = Histogram("summary_stage_seconds", "Time spent in each stage of building a summary", ["stage"])
+LLM_REQUEST_SECONDS = Histogram("llm_request_seconds", "Latency of LLM calls", ["purpose"])
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens reported by the provider", ["purpose", "direction"])
+
+
+def record_llm_usage(purpose: str, response) -> Optional[Dict]:
+    """Count the token usage the provider reported on an LLM response"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), purpose=purpose, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), purpose=purpose, direction="output")
+    return usage
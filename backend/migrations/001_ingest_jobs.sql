@@ -0,0 +1,25 @@
+-- Durable ingestion jobs and idempotent chunk writes.
+
+create table if not exists ingest_jobs (
+    id uuid primary key default gen_random_uuid(),
+    file_id uuid not null unique references files(id) on delete cascade,
+    file_name text not null,
+    status text not null default 'queued'
+        check (status in ('queued', 'running', 'completed', 'failed')),
+    attempts integer not null default 0,
+    error text,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists ingest_jobs_status_idx on ingest_jobs (status, updated_at);
+
+-- Retries upsert on (file_id, chunk_id) instead of inserting duplicates.
+delete from embeddings a
+    using embeddings b
+    where a.file_id = b.file_id
+      and a.chunk_id = b.chunk_id
+      and a.ctid > b.ctid;
+
+alter table embeddings
+    add constraint embeddings_file_id_chunk_id_key unique (file_id, chunk_id);
@@ -0,0 +1,30 @@
+-- Content-addressed cache of document embeddings.
+-- key = sha256(model || '\0' || normalized chunk text)
+
+create table if not exists embedding_cache (
+    key text primary key,
+    model text not null,
+    embedding real[] not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists embedding_cache_created_at_idx on embedding_cache (created_at);
+
+-- Keeps the table bounded by dropping the oldest entries.
+create or replace function prune_embedding_cache(max_rows integer)
+returns integer
+language plpgsql
+as $$
+declare
+    removed integer;
+begin
+    delete from embedding_cache
+    where key in (
+        select key from embedding_cache
+        order by created_at desc
+        offset max_rows
+    );
+    get diagnostics removed = row_count;
+    return removed;
+end;
+$$;
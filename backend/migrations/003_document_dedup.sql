@@ -0,0 +1,7 @@
+-- Whole-document dedup: identical uploads share one set of embeddings.
+
+alter table files add column if not exists content_hash text;
+alter table files add column if not exists index_file_id uuid references files(id) on delete set null;
+
+create index if not exists files_content_hash_idx on files (content_hash);
+create index if not exists files_index_file_id_idx on files (index_file_id);
@@ -0,0 +1,4 @@
+-- Summaries precomputed at ingest time and served as a plain read.
+
+alter table files add column if not exists summary jsonb;
+alter table files add column if not exists summary_version text;
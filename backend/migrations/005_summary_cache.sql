@@ -0,0 +1,8 @@
+-- Intermediate map/reduce summaries, keyed by sha256 of prompt, model and
+-- input text, so unchanged sections are never summarized twice.
+
+create table if not exists summary_cache (
+    key text primary key,
+    summary text not null,
+    created_at timestamptz not null default now()
+);
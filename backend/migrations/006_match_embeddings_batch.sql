@@ -0,0 +1,38 @@
+-- Similarity search for several queries against one document in a single call.
+-- query_embeddings is a JSON array of 768-d vectors; rows carry the position
+-- of the query they answer.
+
+create or replace function match_embeddings_batch(
+    query_embeddings jsonb,
+    match_count integer,
+    filter_file_id uuid
+)
+returns table (
+    query_index integer,
+    chunk_id integer,
+    page integer,
+    content text,
+    similarity double precision
+)
+language sql stable
+as $$
+    select
+        (q.position - 1)::integer as query_index,
+        m.chunk_id,
+        m.page,
+        m.content,
+        m.similarity
+    from jsonb_array_elements(query_embeddings) with ordinality as q(embedding, position)
+    cross join lateral (
+        select
+            e.chunk_id,
+            e.page,
+            e.content,
+            1 - (e.embedding <=> (q.embedding::text)::vector) as similarity
+        from embeddings e
+        where e.file_id = filter_file_id
+        order by e.embedding <=> (q.embedding::text)::vector
+        limit match_count
+    ) m
+    order by q.position, m.similarity desc;
+$$;
@@ -0,0 +1,9 @@
+-- Per-document BM25 inverted index for hybrid retrieval, stored as
+-- zlib-compressed JSON (base64) next to the document's embeddings.
+
+create table if not exists lexical_indexes (
+    file_id uuid primary key references files(id) on delete cascade,
+    data text not null,
+    chunk_count integer not null,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,85 @@
+-- Compact embedding storage (EMBEDDING_STORAGE=compact).
+--
+-- embedding_half keeps each vector as float16 (pgvector >= 0.7 halfvec),
+-- optionally truncated to EMBEDDING_COMPACT_DIMS leading components and
+-- renormalized. Search ranks a document's chunks by Hamming distance of
+-- their sign bits, then rescores the best candidate_count rows with the
+-- exact cosine distance to the query.
+
+alter table embeddings add column if not exists embedding_half halfvec;
+alter table embeddings alter column embedding drop not null;
+
+-- Backfill existing rows. For truncated storage use
+--   l2_normalize(subvector(embedding, 1, <dims>))::halfvec
+-- with the same <dims> as EMBEDDING_COMPACT_DIMS.
+update embeddings
+    set embedding_half = embedding::halfvec
+    where embedding_half is null and embedding is not null;
+
+-- Once every service runs with EMBEDDING_STORAGE=compact, reclaim the
+-- float32 column:
+--   update embeddings set embedding = null;
+--   vacuum full embeddings;
+
+create or replace function match_embeddings_compact(
+    query_embedding halfvec,
+    match_count integer,
+    candidate_count integer,
+    filter_file_id uuid
+)
+returns table (
+    chunk_id integer,
+    page integer,
+    content text,
+    similarity double precision
+)
+language sql stable
+as $$
+    with candidates as (
+        select e.chunk_id, e.page, e.content, e.embedding_half
+        from embeddings e
+        where e.file_id = filter_file_id
+          and e.embedding_half is not null
+        order by binary_quantize(e.embedding_half) <~> binary_quantize(query_embedding)
+        limit candidate_count
+    )
+    select
+        c.chunk_id,
+        c.page,
+        c.content,
+        1 - (c.embedding_half <=> query_embedding) as similarity
+    from candidates c
+    order by c.embedding_half <=> query_embedding
+    limit match_count;
+$$;
+
+create or replace function match_embeddings_compact_batch(
+    query_embeddings jsonb,
+    match_count integer,
+    candidate_count integer,
+    filter_file_id uuid
+)
+returns table (
+    query_index integer,
+    chunk_id integer,
+    page integer,
+    content text,
+    similarity double precision
+)
+language sql stable
+as $$
+    select
+        (q.position - 1)::integer as query_index,
+        m.chunk_id,
+        m.page,
+        m.content,
+        m.similarity
+    from jsonb_array_elements(query_embeddings) with ordinality as q(embedding, position)
+    cross join lateral match_embeddings_compact(
+        (q.embedding::text)::halfvec,
+        match_count,
+        candidate_count,
+        filter_file_id
+    ) m
+    order by q.position, m.similarity desc;
+$$;
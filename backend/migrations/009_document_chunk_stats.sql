@@ -0,0 +1,20 @@
+-- Chunk and page counts of a document, aggregated in the database instead
+-- of transferring every chunk row. Keyset pagination of chunks (file_id,
+-- chunk_id > last) is served by the embeddings_file_id_chunk_id_key index
+-- from 001.
+
+create or replace function document_chunk_stats(filter_file_id uuid)
+returns table (
+    total_chunks integer,
+    page_count integer,
+    pages integer[]
+)
+language sql stable
+as $$
+    select
+        count(*)::integer as total_chunks,
+        count(distinct page)::integer as page_count,
+        array_agg(distinct page order by page) as pages
+    from embeddings
+    where file_id = filter_file_id;
+$$;
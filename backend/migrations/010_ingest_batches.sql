@@ -0,0 +1,13 @@
+-- Fair-share ingest scheduling and batch uploads.
+
+-- Jobs remember who uploaded them and how large the PDF is, so jobs picked
+-- up by the recovery sweep are queued per tenant, smallest first.
+alter table ingest_jobs
+    add column if not exists tenant_id text,
+    add column if not exists size_bytes bigint;
+
+-- Documents uploaded together through /upload-pdfs share a batch id.
+alter table files
+    add column if not exists batch_id uuid;
+
+create index if not exists files_batch_id_idx on files (batch_id) where batch_id is not null;
@@ -0,0 +1,30 @@
+-- Single-query similarity search with the same columns as
+-- match_embeddings_batch. Hybrid search fuses these rows with BM25 hits by
+-- chunk_id, so the column must be returned. The return type changes, which
+-- `create or replace` cannot do, so the old function is dropped first.
+
+drop function if exists match_embeddings(vector, integer, uuid);
+
+create function match_embeddings(
+    query_embedding vector(768),
+    match_count integer,
+    filter_file_id uuid
+)
+returns table (
+    chunk_id integer,
+    page integer,
+    content text,
+    similarity double precision
+)
+language sql stable
+as $$
+    select
+        e.chunk_id,
+        e.page,
+        e.content,
+        1 - (e.embedding <=> query_embedding) as similarity
+    from embeddings e
+    where e.file_id = filter_file_id
+    order by e.embedding <=> query_embedding
+    limit match_count;
+$$;
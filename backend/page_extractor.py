@@ -0,0 +1,73 @@
+import mmap
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+from pypdf import PdfReader
+
+# Kept free of heavy imports: this module is what extraction worker
+# processes load.
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Worker: raw text of pages [start, end) of the PDF at `path`"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_extract_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process-wide extraction pool, shared by concurrent ingest jobs.
+    Workers start through forkserver (spawn where unavailable), since
+    forking the threaded API process is unsafe.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _pool
+
+
+def shutdown_extract_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def iter_pages_parallel(path: str, page_count: int, workers: int, pages_per_task: int) -> Iterator[str]:
+    """
+    Raw text of every page, in page order, with page ranges extracted
+    across `workers` processes that each memory-map the file at `path`.
+
+    `pages_per_task` is the smallest range handed to a worker. At most two
+    tasks per worker are in flight, so pages stream out in order while
+    memory stays bounded on very large PDFs.
+    """
+    pool = get_extract_pool(workers)
+    # Every task re-opens the PDF, so use few, large ranges: about four per worker
+    pages_per_task = max(pages_per_task, -(-page_count // (workers * 4)))
+    ranges = deque(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < workers * 2:
+                start, end = ranges.popleft()
+                pending.append(pool.submit(extract_page_range, path, start, end))
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
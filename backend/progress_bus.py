@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.update: Optional[Dict] = None
+        self.done = False
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # the client's event loop is gone
+
+
+class ProgressBus:
+    """
+    Live processing status of the documents this process is ingesting.
+
+    Ingest workers publish every update here and streaming clients are woken
+    with the latest one; a slow client skips intermediate updates rather than
+    queueing them. The `files` row is only written on stage transitions and
+    at most once every `persist_interval` seconds otherwise, which is what
+    other processes and restarted jobs see.
+    """
+
+    def __init__(self, supabase, persist_interval: float = None):
+        self.supabase = supabase
+        self.persist_interval = persist_interval if persist_interval is not None \
+            else float(os.getenv("PROGRESS_PERSIST_INTERVAL", "5"))
+
+        self._documents: Dict[str, Dict] = {}
+        self._subscribers: Dict[str, List[_Subscriber]] = {}
+        self._lock = threading.Lock()
+
+        self.updates = 0
+        self.writes = 0
+
+    def publish(self, document_id: str, status: Dict, fields: Dict = None, persist: bool = False) -> bool:
+        """
+        Record a status update, with optional other `files` columns.
+        `persist` forces the write (stage transitions). Returns True when
+        the update was written to the database.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._documents.setdefault(document_id, {"fields": {}, "pending": {}, "persisted_at": None})
+            entry["status"] = dict(status)
+            entry["fields"].update(fields or {})
+            entry["pending"].update(fields or {})
+            self.updates += 1
+
+            write = persist or entry["persisted_at"] is None \
+                or now - entry["persisted_at"] >= self.persist_interval
+            if write:
+                pending, entry["pending"] = entry["pending"], {}
+                entry["persisted_at"] = now
+
+            update = self._snapshot(document_id, entry)
+            subscribers = list(self._subscribers.get(document_id, ()))
+            for subscriber in subscribers:
+                subscriber.update = update
+
+        for subscriber in subscribers:
+            subscriber.wake()
+
+        if write:
+            self.supabase.table("files").update({
+                **pending,
+                "processing_status": status
+            }).eq("id", document_id).execute()
+            self.writes += 1
+        return write
+
+    def finish(self, document_id: str):
+        """The ingest of a document ended; its streams close after their last update"""
+        with self._lock:
+            self._documents.pop(document_id, None)
+            subscribers = self._subscribers.pop(document_id, [])
+            for subscriber in subscribers:
+                subscriber.done = True
+        for subscriber in subscribers:
+            subscriber.wake()
+
+    def snapshot(self, document_id: str) -> Optional[Dict]:
+        """Latest status of a document ingesting here, shaped like its `files` row"""
+        with self._lock:
+            entry = self._documents.get(document_id)
+            return self._snapshot(document_id, entry) if entry else None
+
+    async def subscribe(self, document_id: str) -> AsyncIterator[Dict]:
+        """
+        The current status, then every update until the ingest ends.
+        Yields nothing for documents that are not ingesting in this process.
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            entry = self._documents.get(document_id)
+            if entry is None:
+                return
+            subscriber.update = self._snapshot(document_id, entry)
+            self._subscribers.setdefault(document_id, []).append(subscriber)
+
+        try:
+            while True:
+                with self._lock:
+                    update, subscriber.update = subscriber.update, None
+                    done = subscriber.done
+                if update is not None:
+                    yield update
+                if done:
+                    return
+                await subscriber.event.wait()
+                subscriber.event.clear()
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(document_id)
+                if subscribers and subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                    if not subscribers:
+                        del self._subscribers[document_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "updates": self.updates,
+                "writes": self.writes
+            }
+
+    @staticmethod
+    def _snapshot(document_id: str, entry: Dict) -> Dict:
+        return {"id": document_id, **entry["fields"], "processing_status": entry["status"]}
@@ -1,11 +1,23 @@
-import os
+import asyncio
+import hashlib
 import json
+import logging
+import os
 import re
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+import time
+from concurrent.futures import Future
 from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv
+from answer_cache import AnswerCache, get_answer_cache
+from clients import get_async_supabase, get_llm
+from context_builder import ContextBuilder
+from metrics import LLM_REQUEST_SECONDS, QA_REQUESTS, QA_STAGE_SECONDS, SUMMARY_STAGE_SECONDS, record_llm_usage
+from summarizer import MAP_PROMPT, REDUCE_PROMPT, HierarchicalSummarizer
 from vector_store import VectorStore
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 
@@ -22,30 +34,13 @@ def extract_json_strict(text: str):
     try:
         return json.loads(match.group())
     except json.JSONDecodeError as e:
-        print(f"❌ JSON parse error: {e}")
-        print(f"Raw text: {text[:500]}")
+        logger.error(f"❌ JSON parse error: {e}")
+        logger.error(f"Raw text: {text[:500]}")
         raise
 
 
-class QAChain:
-    def __init__(self, document_id: str):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in .env")
-
-        print(f"🤖 Initializing QA chain for document: {document_id}")
-
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=api_key,
-            temperature=0.2,
-        )
-
-        self.vector_store = VectorStore()
-        self.document_id = document_id
-
-        # Question-answering prompt
-        self.prompt_template = PromptTemplate.from_template("""
+# Question-answering prompt
+QA_PROMPT = PromptTemplate.from_template("""
 You are an AI assistant answering questions strictly and exclusively using the provided document context.
 
 ABSOLUTE RULES:
@@ -80,85 +75,12 @@ QUESTION:
 ANSWER:
 """)
 
-        print("✅ QA chain initialized successfully")
-
-    # ==========================
-    # ❓ QUESTION ANSWERING
-    # ==========================
-    def ask(self, question: str):
-        """Answer a question using vector similarity search and LLM"""
-        print(f"❓ Question: {question[:100]}")
-        
-        try:
-            # Search for relevant chunks
-            raw_chunks = self.vector_store.search_similar(
-                file_id=self.document_id,
-                query=question,
-                top_k=12
-            )
-
-            if not raw_chunks:
-                print("⚠️ No relevant chunks found")
-                return {
-                    "answer": "The document does not contain this information.",
-                    "sources": []
-                }
-
-            # Build context from chunks
-            seen_pages = set()
-            context_blocks = []
-
-            for chunk in raw_chunks:
-                page = chunk.get("page", 0)
-                text = chunk.get("content") or chunk.get("text") or ""
-                
-                if not text.strip():
-                    continue
-
-
-                seen_pages.add(page)
-                context_blocks.append(f"(Page {page}) {text[:1000]}")
-
-                if len(context_blocks) >= 6:
-                    break
 
-            if not context_blocks:
-                return {
-                    "answer": "The document does not contain this information.",
-                }
-
-            context = "\n\n".join(context_blocks)
-            print(f"📚 Using {len(context_blocks)} chunks from pages: {sorted(seen_pages)}")
-
-            # Generate answer
-            prompt = self.prompt_template.format(
-                context=context,
-                question=question
-            )
-
-            response = self.llm.invoke(prompt)
-            answer = response.content.strip()
+QA_MODEL = "gemini-2.5-flash"
 
-            print(f"✅ Generated answer ({len(answer)} chars)")
 
-            return {
-                "answer": answer
-            }
-
-        except Exception as e:
-            print(f"❌ Error in ask(): {e}")
-            return {
-                "answer": f"Error processing question: {str(e)}",
-            }
-
-    # ==========================
-    # 📄 SUMMARY GENERATION
-    # ==========================
-    def generate_summary(self):
-        """Generate a comprehensive structured summary of the document"""
-        print(f"📝 Generating summary for document: {self.document_id}")
-        
-        SUMMARY_PROMPT = PromptTemplate.from_template("""
+# Structured summary prompt
+SUMMARY_PROMPT = PromptTemplate.from_template("""
 You are an expert document analyst creating a comprehensive summary using ONLY the provided context.
 
 YOUR TASK:
@@ -214,110 +136,445 @@ CONTEXT:
 Generate a comprehensive, detailed summary now:
 """)
 
+SUMMARY_MODEL = "gemini-2.0-flash-exp"
+
+# Stored summaries are only reused while the final, map and reduce prompts
+# and the model they were built with are unchanged
+SUMMARY_VERSION = hashlib.sha256(
+    "\x00".join([SUMMARY_PROMPT.template, MAP_PROMPT.template, REDUCE_PROMPT.template, SUMMARY_MODEL]).encode("utf-8")
+).hexdigest()[:16]
+
+# Summaries being precomputed by an ingest job, keyed by index id, so a
+# request arriving meanwhile waits for that result instead of duplicating it
+_summary_builds: "dict[str, Future]" = {}
+_summary_builds_lock = threading.Lock()
+
+
+class QAChain:
+    def __init__(
+        self,
+        document_id: str,
+        vector_store: VectorStore = None,
+        llm=None,
+        summary_llm=None,
+        answer_cache: AnswerCache = None,
+        summarizer: HierarchicalSummarizer = None
+    ):
+        """
+        Per-document session. Only document-scoped state lives here; the LLM,
+        embedding and Supabase clients are the shared process-wide instances.
+        """
+        logger.debug(f"🤖 Initializing QA chain for document: {document_id}")
+
+        self.llm = llm or get_llm(QA_MODEL, temperature=0.2)
+        # Slightly higher temperature and longer output for detailed summaries
+        self.summary_llm = summary_llm or get_llm(SUMMARY_MODEL, temperature=0.4, max_output_tokens=4096)
+
+        self.vector_store = vector_store or VectorStore()
+        self.document_id = document_id
+        # Deduplicated uploads are served from the original document's chunks
+        self.index_id = self.vector_store.resolve_index_id(document_id)
+        self.prompt_template = QA_PROMPT
+        # Hybrid retrieval ranks well enough at small k to keep prompts short
+        self.top_k = int(os.getenv("QA_TOP_K", "5"))
+        self.context_builder = ContextBuilder(QA_MODEL)
+        # Answers are cached per index, so deduplicated uploads share them
+        self.answer_cache = answer_cache or get_answer_cache()
+        self.summarizer = summarizer or HierarchicalSummarizer(self.summary_llm, self.vector_store)
+
+        logger.debug("✅ QA chain initialized successfully")
+
+    # ==========================
+    # ❓ QUESTION ANSWERING
+    # ==========================
+    def ask(self, question: str):
+        """Answer a question using hybrid (vector + BM25) search and LLM"""
+        logger.debug(f"❓ Question: {question[:100]}")
+        
         try:
-            # Get more chunks for better coverage
-            raw_chunks = self.vector_store.search_similar(
-                file_id=self.document_id,
-                query="introduction abstract overview summary main content key points findings results conclusion methodology discussion objectives purpose background",
-                top_k=30  
-            )
-
-            if not raw_chunks:
-                print("⚠️ No chunks found for summary")
-                return {
-                    "summary": [
-                        {
-                            "title": "Document Overview",
-                            "content": "Unable to generate summary - no text content found.",
-                            "icon": "📄"
-                        }
-                    ]
-                }
+            cached = self.answer_cache.get_exact(self.index_id, question)
+            if cached:
+                logger.debug("⚡ Answer cache hit (exact)")
+                QA_REQUESTS.inc(result="cache_exact")
+                return {"answer": cached["answer"]}
+
+            with QA_STAGE_SECONDS.time(stage="embed_query"):
+                query_embedding = self.vector_store.embed_query(question)
+            cached = self.answer_cache.get_similar(self.index_id, query_embedding)
+            if cached:
+                logger.debug("⚡ Answer cache hit (semantic)")
+                QA_REQUESTS.inc(result="cache_semantic")
+                return {"answer": cached["answer"]}
 
-            # Build comprehensive context
-            seen_pages = set()
-            context_blocks = []
-
-            for chunk in raw_chunks:
-                page = chunk.get("page", 0)
-                text = chunk.get("content") or chunk.get("text") or ""
-
-                if not text.strip() or page in seen_pages:
-                    continue
-
-                seen_pages.add(page)
-                # Include more text per chunk for better context
-                context_blocks.append(f"(Page {page}) {text[:1500]}")
-
-                # Increase the number of chunks used
-                if len(context_blocks) >= 20:  # Increased from 10
-                    break
-
-            context = "\n\n".join(context_blocks)
-            print(f"📚 Using {len(context_blocks)} chunks for summary (total: {len(context)} chars)")
-
-            # Generate summary with higher temperature for more detailed output
-            llm_for_summary = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash-exp",
-                google_api_key=os.getenv("GOOGLE_API_KEY"),
-                temperature=0.4,  # Slightly higher for more creative/detailed summaries
-                max_output_tokens=4096  # Allow longer responses
-            )
-
-            response = llm_for_summary.invoke(
-                SUMMARY_PROMPT.format(context=context)
-            )
-
-            print(f"🤖 Raw response length: {len(response.content)}")
-
-            # Extract and parse JSON
-            try:
-                result = extract_json_strict(response.content)
-                
-                # Validate structure
-                if "summary" not in result or not isinstance(result["summary"], list):
-                    raise ValueError("Invalid summary structure")
-                
-                # Validate each section
-                for section in result["summary"]:
-                    if not all(k in section for k in ["title", "content", "icon"]):
-                        raise ValueError("Missing required fields in summary section")
-                
-                # Check if sections are too short
-                avg_length = sum(len(s["content"]) for s in result["summary"]) / len(result["summary"])
-                print(f"📊 Generated {len(result['summary'])} sections, avg length: {avg_length:.0f} chars")
-                
-                if avg_length < 200:
-                    print("⚠️ Warning: Sections are short. Consider providing more context.")
-                
+            # Search for relevant chunks
+            with QA_STAGE_SECONDS.time(stage="retrieve"):
+                raw_chunks = self.vector_store.hybrid_search(
+                    file_id=self.index_id,
+                    query=question,
+                    top_k=self.top_k,
+                    query_embedding=query_embedding
+                )
+
+            prompt, pages, result = self._prepare_answer(question, raw_chunks)
+            if result:
                 return result
 
-            except Exception as parse_error:
-                print(f"❌ JSON parsing failed: {parse_error}")
-                print(f"Raw response: {response.content[:500]}")
-                
-                # Fallback: return raw content as single section
-                return {
-                    "summary": [
-                        {
-                            "title": "Document Summary",
-                            "content": response.content.strip()[:1000] + "...",
-                            "icon": "📄"
-                        }
-                    ]
-                }
+            with QA_STAGE_SECONDS.time(stage="llm"), LLM_REQUEST_SECONDS.time(purpose="answer"):
+                response = self.llm.invoke(prompt)
+            result = self._finish_answer(response)
+            self._remember_answer(question, query_embedding, result["answer"], pages)
+            return result
 
         except Exception as e:
-            print(f"❌ Error generating summary: {e}")
-            import traceback
-            traceback.print_exc()
-            
+            QA_REQUESTS.inc(result="error")
+            logger.error(f"❌ Error in ask(): {e}")
+            return {
+                "answer": f"Error processing question: {str(e)}",
+            }
+
+    async def aask(self, question: str):
+        """Async ask(): embedding, search and LLM call never block the event loop"""
+        logger.debug(f"❓ Question: {question[:100]}")
+
+        try:
+            cached = self.answer_cache.get_exact(self.index_id, question)
+            if cached:
+                logger.debug("⚡ Answer cache hit (exact)")
+                QA_REQUESTS.inc(result="cache_exact")
+                return {"answer": cached["answer"]}
+
+            with QA_STAGE_SECONDS.time(stage="embed_query"):
+                query_embedding = await self.vector_store.aembed_query(question)
+            cached = self.answer_cache.get_similar(self.index_id, query_embedding)
+            if cached:
+                logger.debug("⚡ Answer cache hit (semantic)")
+                QA_REQUESTS.inc(result="cache_semantic")
+                return {"answer": cached["answer"]}
+
+            with QA_STAGE_SECONDS.time(stage="retrieve"):
+                raw_chunks = await self.vector_store.ahybrid_search(
+                    file_id=self.index_id,
+                    query=question,
+                    top_k=self.top_k,
+                    query_embedding=query_embedding
+                )
+
+            prompt, pages, result = self._prepare_answer(question, raw_chunks)
+            if result:
+                return result
+
+            with QA_STAGE_SECONDS.time(stage="llm"), LLM_REQUEST_SECONDS.time(purpose="answer"):
+                response = await self.llm.ainvoke(prompt)
+            result = self._finish_answer(response)
+            self._remember_answer(question, query_embedding, result["answer"], pages)
+            return result
+
+        except Exception as e:
+            QA_REQUESTS.inc(result="error")
+            logger.error(f"❌ Error in aask(): {e}")
             return {
+                "answer": f"Error processing question: {str(e)}",
+            }
+
+    async def astream_ask(self, question: str):
+        """
+        Streaming aask(). Yields {"type": "token", "text": ...} events while
+        the LLM generates, then one {"type": "done", "answer": ..., "pages": [...]}
+        (or {"type": "error", ...}) event.
+        """
+        logger.debug(f"❓ Question (stream): {question[:100]}")
+
+        try:
+            cached = self.answer_cache.get_exact(self.index_id, question)
+            tier = "exact"
+            if not cached:
+                with QA_STAGE_SECONDS.time(stage="embed_query"):
+                    query_embedding = await self.vector_store.aembed_query(question)
+                cached = self.answer_cache.get_similar(self.index_id, query_embedding)
+                tier = "semantic"
+
+            if cached:
+                logger.debug(f"⚡ Answer cache hit ({tier})")
+                QA_REQUESTS.inc(result=f"cache_{tier}")
+                yield {"type": "token", "text": cached["answer"]}
+                yield {"type": "done", "answer": cached["answer"], "pages": cached["pages"]}
+                return
+
+            with QA_STAGE_SECONDS.time(stage="retrieve"):
+                raw_chunks = await self.vector_store.ahybrid_search(
+                    file_id=self.index_id,
+                    query=question,
+                    top_k=self.top_k,
+                    query_embedding=query_embedding
+                )
+
+            prompt, pages, result = self._prepare_answer(question, raw_chunks)
+            if result:
+                yield {"type": "done", "answer": result["answer"], "pages": []}
+                return
+
+            parts = []
+            usage = None
+            start = time.perf_counter()
+            async for chunk in self.llm.astream(prompt):
+                if not parts:
+                    QA_STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_token")
+                # Providers report usage on the final chunk(s)
+                usage = chunk if usage is None else usage + chunk
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield {"type": "token", "text": chunk.text}
+            elapsed = time.perf_counter() - start
+            QA_STAGE_SECONDS.observe(elapsed, stage="llm")
+            LLM_REQUEST_SECONDS.observe(elapsed, purpose="answer")
+            record_llm_usage("answer", usage)
+            QA_REQUESTS.inc(result="answered")
+
+            answer = "".join(parts).strip()
+            logger.debug(f"✅ Streamed answer ({len(answer)} chars)")
+            self._remember_answer(question, query_embedding, answer, pages)
+
+            yield {"type": "done", "answer": answer, "pages": pages}
+
+        except Exception as e:
+            QA_REQUESTS.inc(result="error")
+            logger.error(f"❌ Error in astream_ask(): {e}")
+            yield {"type": "error", "answer": f"Error processing question: {str(e)}"}
+
+    def _prepare_answer(self, question: str, raw_chunks):
+        """
+        Build the QA prompt. Returns (prompt, pages used, None), or
+        (None, [], early result) when there is no usable context.
+        """
+        if not raw_chunks:
+            logger.warning("⚠️ No relevant chunks found")
+            QA_REQUESTS.inc(result="no_context")
+            return None, [], {
+                "answer": "The document does not contain this information.",
+                "sources": []
+            }
+
+        with QA_STAGE_SECONDS.time(stage="context"):
+            context, pages = self.context_builder.build(raw_chunks)
+        if not context:
+            QA_REQUESTS.inc(result="no_context")
+            return None, [], {
+                "answer": "The document does not contain this information.",
+            }
+
+        # Generate answer
+        prompt = self.prompt_template.format(
+            context=context,
+            question=question
+        )
+        return prompt, pages, None
+
+    def _remember_answer(self, question: str, query_embedding, answer: str, pages):
+        # Only LLM answers are cached; empty-context results may come from a failed search
+        if answer:
+            self.answer_cache.put(self.index_id, question, query_embedding, {
+                "answer": answer,
+                "pages": pages
+            })
+
+    def _finish_answer(self, response):
+        answer = response.content.strip()
+        record_llm_usage("answer", response)
+        QA_REQUESTS.inc(result="answered")
+
+        logger.debug(f"✅ Generated answer ({len(answer)} chars)")
+
+        return {
+            "answer": answer
+        }
+
+    # ==========================
+    # 📄 SUMMARY GENERATION
+    # ==========================
+    def generate_summary(self):
+        """Generate a comprehensive structured summary of the document"""
+        logger.info(f"📝 Generating summary for document: {self.document_id}")
+
+        try:
+            stored = self.load_summary()
+            if stored:
+                logger.info("⚡ Serving stored summary")
+                return stored
+
+            result, valid = self._build_summary()
+            if valid:
+                self.save_summary(result)
+            return result
+
+        except Exception as e:
+            return self._summary_error(e)
+
+    async def agenerate_summary(self):
+        """Async generate_summary() for the request path"""
+        logger.info(f"📝 Generating summary for document: {self.document_id}")
+
+        try:
+            stored = await self.aload_summary()
+            if stored:
+                logger.info("⚡ Serving stored summary")
+                return stored
+
+            with _summary_builds_lock:
+                pending = _summary_builds.get(self.index_id)
+            if pending:
+                logger.info("⏳ Waiting for the summary being precomputed")
+                result, _ = await asyncio.wrap_future(pending)
+                return result
+
+            # Map-reduce fans out over a thread pool, so run it off the event loop
+            result, valid = await asyncio.to_thread(self._build_summary)
+            if valid:
+                await self.asave_summary(result)
+            return result
+
+        except Exception as e:
+            return self._summary_error(e)
+
+    def precompute_summary(self):
+        """
+        Ingest stage: build the summary now and store it with the document,
+        so opening the Summarize page is a read instead of an LLM call.
+        """
+        future = Future()
+        with _summary_builds_lock:
+            _summary_builds[self.index_id] = future
+
+        try:
+            result, valid = self._build_summary()
+            if valid:
+                self.save_summary(result)
+            future.set_result((result, valid))
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _summary_builds_lock:
+                _summary_builds.pop(self.index_id, None)
+
+    def _build_summary(self):
+        """Returns (summary, valid); only valid summaries are stored"""
+        with SUMMARY_STAGE_SECONDS.time(stage="total"):
+            # Covers every chunk of the document through map-reduce
+            with SUMMARY_STAGE_SECONDS.time(stage="context"):
+                context = self.summarizer.build_context(self.index_id)
+
+            prompt, result = self._prepare_summary(context)
+            if result:
+                return result, False
+
+            with SUMMARY_STAGE_SECONDS.time(stage="llm"), LLM_REQUEST_SECONDS.time(purpose="summary"):
+                response = self.summary_llm.invoke(prompt)
+            record_llm_usage("summary", response)
+            return self._parse_summary(response)
+
+    # 🔹 Stored summaries live on the index document's row
+    def load_summary(self):
+        result = self.vector_store.supabase.table("files")\
+            .select("summary, summary_version")\
+            .eq("id", self.index_id)\
+            .execute()
+        return self._stored_summary(result.data)
+
+    async def aload_summary(self):
+        client = self.vector_store.async_supabase or await get_async_supabase()
+        result = await client.table("files")\
+            .select("summary, summary_version")\
+            .eq("id", self.index_id)\
+            .execute()
+        return self._stored_summary(result.data)
+
+    def save_summary(self, summary):
+        self.vector_store.supabase.table("files").update({
+            "summary": summary,
+            "summary_version": SUMMARY_VERSION
+        }).eq("id", self.index_id).execute()
+
+    async def asave_summary(self, summary):
+        client = self.vector_store.async_supabase or await get_async_supabase()
+        await client.table("files").update({
+            "summary": summary,
+            "summary_version": SUMMARY_VERSION
+        }).eq("id", self.index_id).execute()
+
+    @staticmethod
+    def _stored_summary(rows):
+        if rows and rows[0].get("summary") and rows[0].get("summary_version") == SUMMARY_VERSION:
+            return rows[0]["summary"]
+        return None
+
+    def _prepare_summary(self, context: str):
+        """Build the summary prompt, or return an early result when there is no text"""
+        if not context:
+            logger.warning("⚠️ No chunks found for summary")
+            return None, {
                 "summary": [
                     {
-                        "title": "Error",
-                        "content": f"Failed to generate summary: {str(e)}",
-                        "icon": "⚠️"
+                        "title": "Document Overview",
+                        "content": "Unable to generate summary - no text content found.",
+                        "icon": "📄"
                     }
                 ]
             }
+
+        logger.info(f"📚 Summary context: {len(context)} chars")
+
+        return SUMMARY_PROMPT.format(context=context), None
+
+    def _parse_summary(self, response):
+        """Returns (summary, valid); invalid output falls back to a raw section"""
+        logger.debug(f"🤖 Raw response length: {len(response.content)}")
+
+        # Extract and parse JSON
+        try:
+            result = extract_json_strict(response.content)
+            
+            # Validate structure
+            if "summary" not in result or not isinstance(result["summary"], list):
+                raise ValueError("Invalid summary structure")
+            
+            # Validate each section
+            for section in result["summary"]:
+                if not all(k in section for k in ["title", "content", "icon"]):
+                    raise ValueError("Missing required fields in summary section")
+            
+            # Check if sections are too short
+            avg_length = sum(len(s["content"]) for s in result["summary"]) / len(result["summary"])
+            logger.info(f"📊 Generated {len(result['summary'])} sections, avg length: {avg_length:.0f} chars")
+            
+            if avg_length < 200:
+                logger.warning("⚠️ Warning: Sections are short. Consider providing more context.")
+            
+            return result, True
+
+        except Exception as parse_error:
+            logger.error(f"❌ JSON parsing failed: {parse_error}")
+            logger.error(f"Raw response: {response.content[:500]}")
+            
+            # Fallback: return raw content as single section
+            return {
+                "summary": [
+                    {
+                        "title": "Document Summary",
+                        "content": response.content.strip()[:1000] + "...",
+                        "icon": "📄"
+                    }
+                ]
+            }, False
+
+    def _summary_error(self, e: Exception):
+        logger.exception(f"❌ Error generating summary: {e}")
+        
+        return {
+            "summary": [
+                {
+                    "title": "Error",
+                    "content": f"Failed to generate summary: {str(e)}",
+                    "icon": "⚠️"
+                }
+            ]
+        }
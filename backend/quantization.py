@@ -0,0 +1,57 @@
+from typing import List
+
+import numpy as np
+
+# Compact embedding storage.
+#
+# Vectors are kept as float16 (pgvector `halfvec`), optionally truncated to
+# their first `dims` components and renormalized. Search is two-stage: a
+# coarse pass ranks a document's chunks by Hamming distance between sign
+# bits (pgvector `binary_quantize`), then the best candidates are rescored
+# with the exact cosine between the float32 query and their float16 vectors.
+# The helpers below mirror that arithmetic so it can be measured offline.
+
+EMBEDDING_DIMS = 768
+
+
+def compact_embedding(embedding: List[float], dims: int = EMBEDDING_DIMS) -> List[float]:
+    """Truncate to `dims`, renormalize and round to float16 precision"""
+    vector = np.asarray(embedding, dtype=np.float32)[:dims]
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector = vector / norm
+    return vector.astype(np.float16).astype(np.float32).tolist()
+
+
+def compact_query(embedding: List[float], dims: int = EMBEDDING_DIMS) -> List[float]:
+    """Query side of compact search: truncated and renormalized, kept at full precision"""
+    vector = np.asarray(embedding, dtype=np.float32)[:dims]
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def binary_codes(matrix: np.ndarray) -> np.ndarray:
+    """Sign bits packed 8 per byte, as binary_quantize() stores them"""
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def _popcount(codes: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(codes)
+    return _POPCOUNT[codes]
+
+
+def two_stage_search(query: np.ndarray, codes: np.ndarray, vectors: np.ndarray, top_k: int, candidates: int) -> np.ndarray:
+    """
+    Row indices of the best `top_k` vectors: Hamming coarse pass over
+    `codes` keeps `candidates` rows, exact cosine against `vectors` (float16)
+    orders them.
+    """
+    distances = _popcount(np.bitwise_xor(codes, binary_codes(query))).sum(axis=1, dtype=np.int32)
+    candidates = min(candidates, len(codes))
+    shortlist = np.argpartition(distances, candidates - 1)[:candidates]
+    scores = vectors[shortlist].astype(np.float32) @ query
+    return shortlist[np.argsort(-scores)[:top_k]]
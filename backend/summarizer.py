@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from langchain_core.prompts import PromptTemplate
+from metrics import LLM_REQUEST_SECONDS, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+
+# Map step: one summary per group of consecutive chunks
+MAP_PROMPT = PromptTemplate.from_template("""
+You are summarizing one part of a longer document, using ONLY the text below.
+
+Write a dense summary of 150-250 words covering every important concept, finding,
+name, number and definition in this part. Do not add outside knowledge, do not
+mention that this is a part of a document, and do not use markdown.
+
+TEXT (pages {pages}):
+{text}
+
+SUMMARY:
+""")
+
+# Reduce step: several consecutive part summaries into one
+REDUCE_PROMPT = PromptTemplate.from_template("""
+You are combining summaries of consecutive parts of one document, using ONLY the
+summaries below.
+
+Write a single summary of at most 400 words that keeps all key facts, names,
+numbers and conclusions, removes repetition and preserves the order of topics.
+Do not add outside knowledge and do not use markdown.
+
+SUMMARIES:
+{text}
+
+COMBINED SUMMARY:
+""")
+
+
+class SummaryCache:
+    """
+    Intermediate (map/reduce) summaries keyed by a hash of the prompt, the
+    model and the input text. Checked in an in-process LRU first, then in the
+    `summary_cache` table, so re-summarizing a document, or a revision that
+    shares most sections, reuses the unchanged parts.
+    """
+
+    def __init__(self, supabase, max_entries: int = None):
+        self.supabase = supabase
+        self.max_entries = max_entries or int(os.getenv("SUMMARY_CACHE_SIZE", "5000"))
+        self._local: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt: PromptTemplate, model: str, text: str) -> str:
+        payload = f"{prompt.template}\x00{model}\x00{text}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return self._local[key]
+
+        summary = None
+        try:
+            result = self.supabase.table("summary_cache")\
+                .select("summary")\
+                .eq("key", key)\
+                .execute()
+            if result.data:
+                summary = result.data[0]["summary"]
+        except Exception as e:
+            logger.warning(f"⚠️ Summary cache lookup failed: {e}")
+
+        with self._lock:
+            if summary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, summary)
+        return summary
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._remember(key, summary)
+        try:
+            self.supabase.table("summary_cache").upsert(
+                {"key": key, "summary": summary},
+                on_conflict="key"
+            ).execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Summary cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._local), "hits": self.hits, "misses": self.misses}
+
+    def _remember(self, key: str, summary: str):
+        self._local[key] = summary
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+class HierarchicalSummarizer:
+    """
+    Map-reduce summarization over every chunk of a document.
+
+    Chunks are grouped in page order into parts of about `group_chars`
+    characters and each part is summarized in parallel (map). Summaries are
+    then merged `fan_in` at a time (reduce) until they fit in `final_chars`,
+    the context budget of the final structured-summary prompt. Documents
+    that already fit are passed through without any map step.
+    """
+
+    def __init__(
+        self,
+        llm,
+        vector_store,
+        cache: SummaryCache = None,
+        group_chars: int = None,
+        final_chars: int = None,
+        fan_in: int = None,
+        max_concurrency: int = None
+    ):
+        self.llm = llm
+        self.vector_store = vector_store
+        self.cache = cache or get_summary_cache(vector_store.supabase)
+        self.group_chars = group_chars or int(os.getenv("SUMMARY_GROUP_CHARS", "12000"))
+        self.final_chars = final_chars or int(os.getenv("SUMMARY_FINAL_CHARS", "60000"))
+        self.fan_in = fan_in or int(os.getenv("SUMMARY_REDUCE_FAN_IN", "8"))
+        self.max_concurrency = max_concurrency or int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+        self.model = getattr(llm, "model", "")
+
+    def build_context(self, file_id: str) -> str:
+        """Context for the final summary prompt, covering the whole document"""
+        chunks = [
+            c for c in self.vector_store.iter_chunks(file_id, columns="chunk_id, page, content")
+            if (c.get("content") or "").strip()
+        ]
+        if not chunks:
+            return ""
+
+        blocks = [
+            {"pages": self._page_range(group), "text": " ".join(c["content"] for c in group)}
+            for group in self._group(chunks)
+        ]
+
+        if sum(len(b["text"]) for b in blocks) > self.final_chars:
+            logger.info(f"🗺️ Map step over {len(blocks)} parts")
+            blocks = self._parallel(MAP_PROMPT, blocks)
+
+        level = 0
+        while len(blocks) > 1 and sum(len(b["text"]) for b in blocks) > self.final_chars:
+            level += 1
+            merged = [blocks[i:i + self.fan_in] for i in range(0, len(blocks), self.fan_in)]
+            logger.info(f"🧩 Reduce level {level}: {len(blocks)} -> {len(merged)} summaries")
+            blocks = self._parallel(REDUCE_PROMPT, [
+                {
+                    "pages": f"{group[0]['pages'].split('-')[0]}-{group[-1]['pages'].split('-')[-1]}",
+                    "text": "\n\n".join(f"(Pages {b['pages']}) {b['text']}" for b in group)
+                }
+                for group in merged
+            ])
+
+        return "\n\n".join(f"(Pages {b['pages']}) {b['text']}" for b in blocks)
+
+    def _group(self, chunks: List[Dict]) -> List[List[Dict]]:
+        groups, current, size = [], [], 0
+        for chunk in chunks:
+            if current and size + len(chunk["content"]) > self.group_chars:
+                groups.append(current)
+                current, size = [], 0
+            current.append(chunk)
+            size += len(chunk["content"])
+        if current:
+            groups.append(current)
+        return groups
+
+    @staticmethod
+    def _page_range(group: List[Dict]) -> str:
+        first, last = group[0].get("page", 0), group[-1].get("page", 0)
+        return str(first) if first == last else f"{first}-{last}"
+
+    def _parallel(self, prompt: PromptTemplate, blocks: List[Dict]) -> List[Dict]:
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="summary") as pool:
+            summaries = list(pool.map(lambda b: self._summarize(prompt, b), blocks))
+        return [{"pages": b["pages"], "text": summary} for b, summary in zip(blocks, summaries)]
+
+    def _summarize(self, prompt: PromptTemplate, block: Dict) -> str:
+        key = self.cache.key(prompt, self.model, block["text"])
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        with LLM_REQUEST_SECONDS.time(purpose="summary_part"):
+            response = self.llm.invoke(prompt.format(pages=block["pages"], text=block["text"]))
+        record_llm_usage("summary_part", response)
+        summary = response.content.strip()
+        self.cache.put(key, summary)
+        return summary
+
+
+_shared_cache: Optional[SummaryCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_summary_cache(supabase) -> SummaryCache:
+    """Process-wide intermediate summary cache"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SummaryCache(supabase)
+        return _shared_cache
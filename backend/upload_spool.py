@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Uploads are written here as the request body arrives, hashed on the way, then
+# streamed to storage and memory-mapped by the ingest job, so no stage ever
+# holds a whole PDF in memory. The ingest job deletes its file when it ends.
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "pdf-uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+# Plain form fields (file ids) are kept in memory, so they get a small budget
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class InvalidUpload(Exception):
+    """Raised when an upload form is malformed or carries something other than PDFs."""
+
+
+class FormSpooler:
+    """
+    Incremental multipart/form-data parser that writes file parts straight
+    into spool files as the request body arrives.
+
+    Feed it the body chunk by chunk; a file over `max_file_bytes`, a body over
+    `max_total_bytes` or a part that is not a PDF raises at once, so nothing
+    past the limit is read or written. Each file is hashed on the way and
+    stored exactly once. On error, call discard() to remove what was spooled.
+    """
+
+    def __init__(self, content_type: Optional[str], max_file_bytes: int = MAX_UPLOAD_BYTES,
+                 max_total_bytes: Optional[int] = None):
+        kind, options = parse_options_header(content_type or "")
+        if kind != b"multipart/form-data" or b"boundary" not in options:
+            raise InvalidUpload("Expected a multipart/form-data upload")
+
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fields: Dict[str, List[str]] = {}
+        # field name -> spooled files, each {filename, path, sha256, size}
+        self.files: Dict[str, List[Dict]] = {}
+        self._received = 0
+        self._field_bytes = 0
+        self._finished = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part = None
+
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    def feed(self, chunk: bytes):
+        self._received += len(chunk)
+        if self.max_total_bytes is not None and self._received > self.max_total_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_total_bytes // (1024 * 1024)} MB")
+        try:
+            self._parser.write(chunk)
+        except FormParserError as e:
+            raise InvalidUpload(f"Malformed upload: {e}")
+
+    def finish(self):
+        if not self._finished:
+            raise InvalidUpload("Upload ended before the form was complete")
+
+    def discard(self):
+        """Remove every spool file, including one cut off mid-part"""
+        if self._part is not None and self._part["out"] is not None:
+            self._part["out"].close()
+            discard(self._part["path"])
+            self._part = None
+        for spooled in self.files.values():
+            for file in spooled:
+                discard(file["path"])
+
+    # 🔹 Parser callbacks
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("latin-1")
+        if b"filename" not in disposition:
+            self._part = {"name": name, "out": None, "value": bytearray()}
+            return
+
+        content_type, _ = parse_options_header(self._headers.get(b"content-type", b""))
+        if content_type != b"application/pdf":
+            raise InvalidUpload("Only PDFs allowed")
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=SPOOL_DIR)
+        self._part = {
+            "name": name,
+            "filename": os.path.basename(disposition[b"filename"].decode("utf-8", "replace")),
+            "out": os.fdopen(fd, "wb", buffering=BLOCK_SIZE),
+            "path": path,
+            "digest": hashlib.sha256(),
+            "size": 0
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        block = data[start:end]
+        if part["out"] is None:
+            self._field_bytes += len(block)
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise InvalidUpload("Form fields are too large")
+            part["value"] += block
+            return
+
+        part["size"] += len(block)
+        if part["size"] > self.max_file_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_file_bytes // (1024 * 1024)} MB")
+        part["digest"].update(block)
+        part["out"].write(block)
+
+    def _on_part_end(self):
+        part, self._part = self._part, None
+        if part["out"] is None:
+            self.fields.setdefault(part["name"], []).append(part["value"].decode("utf-8", "replace"))
+            return
+
+        part["out"].close()
+        self.files.setdefault(part["name"], []).append(
+            {
+                "filename": part["filename"],
+                "path": part["path"],
+                "sha256": part["digest"].hexdigest(),
+                "size": part["size"]
+            }
+        )
+
+    def _on_end(self):
+        self._finished = True
+
+
+def discard(path: Optional[str]):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠️ Could not remove spooled upload {path}: {e}")
+
+
+def sweep_stale(max_age_seconds: float = None):
+    """Remove spool files left behind by a process that died mid-ingest"""
+    max_age_seconds = max_age_seconds if max_age_seconds is not None \
+        else float(os.getenv("UPLOAD_SPOOL_MAX_AGE", str(24 * 3600)))
+    if not os.path.isdir(SPOOL_DIR):
+        return
+
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for entry in os.scandir(SPOOL_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"🧹 Removed {removed} stale spooled uploads")
@@ -1,33 +1,97 @@
+import asyncio
+import logging
 import os
-from typing import List, Dict
-from supabase import create_client
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import re
+import string
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
 from dotenv import load_dotenv
+from clients import EMBEDDING_MODEL, get_async_supabase, get_embeddings, get_supabase
+from embedding_cache import get_embedding_cache
+from lexical_index import LexicalIndex, get_lexical_index_cache, reciprocal_rank_fusion
+from local_index import LocalIndexCache, LocalVectorIndex, get_local_index_cache
+from metrics import (
+    DB_WRITE_SECONDS, EMBEDDING_REQUEST_SECONDS, EMBEDDING_RETRIES, EMBEDDING_TEXTS, VECTOR_SEARCH_SECONDS
+)
+from quantization import EMBEDDING_DIMS, compact_embedding, compact_query
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Provider limits for a single batchEmbedContents request
+MAX_EMBED_BATCH_SIZE = 100
+MAX_EMBED_TOKENS_PER_REQUEST = 20000
+
+_TOKEN_SPLIT = re.compile(f"([{re.escape(string.punctuation)}\t\n ])")
+
+
+def _estimate_tokens(text: str) -> int:
+    """Same conservative estimate the embeddings client uses to split requests"""
+    return len([segment for segment in _TOKEN_SPLIT.split(text) if segment]) * 2
+
+
+def _is_limit_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return "invalid_argument" in message and any(
+        hint in message for hint in ("at most", "payload size", "exceeds", "too large", "too many")
+    )
+
+
+def _is_transient_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(
+        hint in message for hint in ("resource_exhausted", "429", "unavailable", "503", "deadline", "timed out")
+    )
+
 
 class VectorStore:
-    def __init__(self):
-        print("🔧 Initializing VectorStore...")
-        
-        # Supabase setup
-        self.supabase = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        )
+    def __init__(
+        self,
+        supabase=None,
+        embedding_model=None,
+        embedding_cache=None,
+        async_supabase=None,
+        retrieval_backend: str = None,
+        local_index: LocalIndexCache = None
+    ):
+        """
+        Clients default to the process-wide shared instances, so constructing
+        a VectorStore is cheap.
 
-        # Google embeddings (768 dimensions)
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in .env")
+        retrieval_backend selects where similarity search runs: "supabase"
+        (the match_embeddings RPC) or "local" (an in-process index built from
+        the document's embeddings on first query).
+        """
+        self.supabase = supabase or get_supabase()
+        self.async_supabase = async_supabase
+        self.embedding_model = embedding_model or get_embeddings()
+        self.embedding_cache = embedding_cache or get_embedding_cache(self.supabase, EMBEDDING_MODEL)
 
-        self.embedding_model = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key
-        )
-        
-        print("✅ VectorStore initialized with Google embeddings (768 dimensions)")
+        self.retrieval_backend = retrieval_backend or os.getenv("RETRIEVAL_BACKEND", "supabase")
+        if self.retrieval_backend not in ("supabase", "local"):
+            raise ValueError(f"Unknown retrieval backend: {self.retrieval_backend}")
+        self.local_index = local_index or (get_local_index_cache() if self.retrieval_backend == "local" else None)
+        self.lexical_cache = get_lexical_index_cache()
+
+        # "full" stores float32 `embedding`, "compact" stores float16
+        # `embedding_half` (optionally truncated) and searches it in two
+        # stages, "both" writes both while existing rows are migrated
+        self.embedding_storage = os.getenv("EMBEDDING_STORAGE", "full")
+        if self.embedding_storage not in ("full", "compact", "both"):
+            raise ValueError(f"Unknown embedding storage: {self.embedding_storage}")
+        self.compact_dims = int(os.getenv("EMBEDDING_COMPACT_DIMS", str(EMBEDDING_DIMS)))
+        self.rescore_candidates = int(os.getenv("COMPACT_RESCORE_CANDIDATES", "100"))
+
+        # Pipelined ingest settings
+        self.embed_concurrency = int(os.getenv("EMBED_CONCURRENCY", "4"))
+        self.embed_batch_size = min(int(os.getenv("EMBED_BATCH_SIZE", str(MAX_EMBED_BATCH_SIZE))), MAX_EMBED_BATCH_SIZE)
+        self.embed_max_tokens = int(os.getenv("EMBED_MAX_TOKENS_PER_REQUEST", str(MAX_EMBED_TOKENS_PER_REQUEST)))
+        self.embed_max_retries = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+        self._batch_size_lock = threading.Lock()
 
     def store_chunk(self, file_id: str, chunk_id: int, page: int, text: str):
         """Store a single chunk with its embedding"""
@@ -36,25 +100,24 @@ class VectorStore:
             embedding = self.embedding_model.embed_query(text)
             
             # Verify dimension
-            if len(embedding) != 768:
-                raise ValueError(f"Expected 768 dimensions, got {len(embedding)}")
+            if len(embedding) != EMBEDDING_DIMS:
+                raise ValueError(f"Expected {EMBEDDING_DIMS} dimensions, got {len(embedding)}")
             
-            # Insert into Supabase
-            self.supabase.table("embeddings").insert({
-                "file_id": file_id,
-                "chunk_id": chunk_id,
-                "page": page,
-                "content": text,
-                "embedding": embedding
-            }).execute()
+            # Upsert into Supabase (idempotent on file_id + chunk_id)
+            self._upsert_rows(self._build_rows(
+                file_id, [{"chunk_id": chunk_id, "page": page, "text": text}], [embedding]
+            ))
             
         except Exception as e:
-            print(f"❌ Error storing chunk {chunk_id}: {e}")
+            logger.error(f"❌ Error storing chunk {chunk_id}: {e}")
             raise
 
     def store_chunks_batch(self, file_id: str, chunks: List[Dict]):
         """
         Store multiple chunks in batch for better performance.
+
+        Rows are upserted on (file_id, chunk_id), so retrying a batch that
+        was partly or fully stored never creates duplicates.
         
         Args:
             file_id: Document identifier
@@ -63,37 +126,20 @@ class VectorStore:
         if not chunks:
             return
         
-        print(f"📦 Batch processing {len(chunks)} chunks...")
+        logger.info(f"📦 Batch processing {len(chunks)} chunks...")
         
         try:
             # Generate embeddings for all chunks
-            texts = [chunk["text"] for chunk in chunks]
-            embeddings = self.embedding_model.embed_documents(texts)
-            
-            # Prepare batch insert data
-            batch_data = []
-            for chunk, embedding in zip(chunks, embeddings):
-                if len(embedding) != 768:
-                    print(f"⚠️ Skipping chunk {chunk['chunk_id']} - wrong dimension: {len(embedding)}")
-                    continue
-                
-                batch_data.append({
-                    "file_id": file_id,
-                    "chunk_id": chunk["chunk_id"],
-                    "page": chunk["page"],
-                    "content": chunk["text"],
-                    "embedding": embedding
-                })
-            
-            # Insert all at once
-            if batch_data:
-                self.supabase.table("embeddings").insert(batch_data).execute()
-                print(f"✅ Stored {len(batch_data)} chunks")
+            embeddings = self._embed_cached([chunk["text"] for chunk in chunks])
+            rows = self._build_rows(file_id, chunks, embeddings)
+            self._upsert_rows(rows)
+            logger.info(f"✅ Stored {len(rows)} chunks")
             
         except Exception as e:
-            print(f"❌ Batch storage error: {e}")
+            logger.error(f"❌ Batch storage error: {e}")
             # Fallback to individual inserts
-            print("⚠️ Falling back to individual inserts...")
+            logger.warning("⚠️ Falling back to individual inserts...")
+            failed = []
             for chunk in chunks:
                 try:
                     self.store_chunk(
@@ -103,9 +149,250 @@ class VectorStore:
                         text=chunk["text"]
                     )
                 except Exception as chunk_error:
-                    print(f"❌ Failed to store chunk {chunk['chunk_id']}: {chunk_error}")
+                    logger.error(f"❌ Failed to store chunk {chunk['chunk_id']}: {chunk_error}")
+                    failed.append(chunk["chunk_id"])
+
+            if failed:
+                raise RuntimeError(f"Failed to store chunks {failed}")
+
+    def store_chunks(
+        self,
+        file_id: str,
+        chunks: Iterable[Dict],
+        on_batch_stored: Optional[Callable[[int], None]] = None
+    ):
+        """
+        Pipelined ingest for a whole document.
+
+        Up to `embed_concurrency` embedding requests run at once, and a single
+        writer thread upserts finished batches in order, so the embedding of
+        later batches overlaps the insert of earlier ones. Because writes are
+        ordered, the stored chunks always form a contiguous prefix.
+
+        `chunks` may be a generator: batches are formed and embedded while it
+        is still producing, so early pages are stored before later ones are
+        even parsed.
+
+        Args:
+            file_id: Document identifier
+            chunks: Iterable of dicts with keys: chunk_id, page, text
+            on_batch_stored: Called from the writer thread with the number of
+                chunks stored so far after every batch
+        """
+        batches = self._plan_batches(chunks)
+        logger.info(f"📦 Pipelining chunks (concurrency {self.embed_concurrency})")
+
+        stored = 0
+        write_errors = []
+
+        def write(batch: List[Dict], embeddings: List[List[float]]):
+            nonlocal stored
+            # Never write past a failed batch, so stored chunks stay a prefix
+            if write_errors:
+                return
+            try:
+                self._upsert_rows(self._build_rows(file_id, batch, embeddings))
+            except Exception as e:
+                write_errors.append(e)
+                raise
+            stored += len(batch)
+            # Queries made meanwhile must see the newly stored chunks
+            if self.local_index:
+                self.local_index.invalidate(file_id)
+            if on_batch_stored:
+                on_batch_stored(stored)
+
+        embed_pool = ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="embed")
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-writer")
+        window = deque()
+        writes = []
+        try:
+            for batch in batches:
+                window.append((batch, embed_pool.submit(self._embed_cached, [c["text"] for c in batch])))
+
+                # Keep a bounded number of embedded batches waiting for the writer
+                if len(window) > self.embed_concurrency:
+                    done_batch, future = window.popleft()
+                    writes.append(writer.submit(write, done_batch, future.result()))
+                    if write_errors:
+                        raise write_errors[0]
+
+            while window:
+                done_batch, future = window.popleft()
+                writes.append(writer.submit(write, done_batch, future.result()))
+
+            for future in writes:
+                future.result()
+        finally:
+            for _, future in window:
+                future.cancel()
+            embed_pool.shutdown(wait=True, cancel_futures=True)
+            writer.shutdown(wait=True, cancel_futures=True)
+            # Any local index was built from the previous embeddings
+            if self.local_index:
+                self.local_index.invalidate(file_id)
+
+        logger.info(f"✅ Stored {stored} chunks")
+
+    def _plan_batches(self, chunks: Iterable[Dict]) -> Iterator[List[Dict]]:
+        """Group chunks so every batch fits in one embedding request, as they arrive"""
+        current, current_tokens = [], 0
+        for chunk in chunks:
+            tokens = _estimate_tokens(chunk["text"])
+            if current and (
+                len(current) >= self.embed_batch_size
+                or current_tokens + tokens > self.embed_max_tokens
+            ):
+                yield current
+                current, current_tokens = [], 0
+            current.append(chunk)
+            current_tokens += tokens
+
+        if current:
+            yield current
+
+    def _embed_cached(self, texts: List[str]) -> List[List[float]]:
+        """Serve cached embeddings and only send the misses to the provider"""
+        embeddings = self.embedding_cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
 
-    def search_similar(self, file_id: str, query: str, top_k: int = 5) -> List[Dict]:
+        if missing:
+            fresh = self._embed_texts([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            self.embedding_cache.put_many([texts[i] for i in missing], fresh)
+
+        return embeddings
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts as a single request.
+
+        Transient provider errors are retried with exponential backoff. When
+        the provider rejects the request size, the batch is halved and the
+        smaller size is kept for the rest of the ingest.
+        """
+        # A previous request may already have taught us a smaller limit
+        limit = self.embed_batch_size
+        if len(texts) > limit:
+            return [
+                embedding
+                for start in range(0, len(texts), limit)
+                for embedding in self._embed_texts(texts[start:start + limit])
+            ]
+
+        attempt = 0
+        while True:
+            try:
+                EMBEDDING_TEXTS.inc(len(texts), kind="document")
+                with EMBEDDING_REQUEST_SECONDS.time(kind="document"):
+                    return self.embedding_model.embed_documents(texts, batch_size=len(texts))
+            except Exception as e:
+                if len(texts) > 1 and _is_limit_error(e):
+                    half = len(texts) // 2
+                    with self._batch_size_lock:
+                        self.embed_batch_size = max(1, min(self.embed_batch_size, half))
+                    logger.warning(f"⚠️ Embedding request too large, reducing batch size to {self.embed_batch_size}")
+                    EMBEDDING_RETRIES.inc(reason="split")
+                    return self._embed_texts(texts[:half]) + self._embed_texts(texts[half:])
+
+                if attempt >= self.embed_max_retries or not _is_transient_error(e):
+                    raise
+
+                attempt += 1
+                delay = 2 ** attempt
+                EMBEDDING_RETRIES.inc(reason="transient")
+                logger.warning(f"⚠️ Embedding failed ({e}), retry {attempt}/{self.embed_max_retries} in {delay}s")
+                time.sleep(delay)
+
+    def _build_rows(self, file_id: str, chunks: List[Dict], embeddings: List[List[float]]) -> List[Dict]:
+        rows = []
+        for chunk, embedding in zip(chunks, embeddings):
+            if len(embedding) != EMBEDDING_DIMS:
+                logger.warning(f"⚠️ Skipping chunk {chunk['chunk_id']} - wrong dimension: {len(embedding)}")
+                continue
+
+            row = {
+                "file_id": file_id,
+                "chunk_id": chunk["chunk_id"],
+                "page": chunk["page"],
+                "content": chunk["text"]
+            }
+            if self.embedding_storage in ("full", "both"):
+                row["embedding"] = embedding
+            if self.embedding_storage in ("compact", "both"):
+                row["embedding_half"] = compact_embedding(embedding, self.compact_dims)
+            rows.append(row)
+        return rows
+
+    def _upsert_rows(self, rows: List[Dict]):
+        # Upsert all at once (idempotent on file_id + chunk_id)
+        if rows:
+            with DB_WRITE_SECONDS.time(table="embeddings"):
+                self.supabase.table("embeddings")\
+                    .upsert(rows, on_conflict="file_id,chunk_id")\
+                    .execute()
+
+    def resolve_index_id(self, file_id: str) -> str:
+        """
+        Return the file whose embeddings serve `file_id`.
+
+        Uploads deduplicated against an identical PDF point at the original
+        through files.index_file_id; every other file is its own index.
+        """
+        try:
+            result = self.supabase.table("files")\
+                .select("index_file_id")\
+                .eq("id", file_id)\
+                .execute()
+
+            if result.data and result.data[0].get("index_file_id"):
+                return result.data[0]["index_file_id"]
+        except Exception as e:
+            logger.warning(f"⚠️ Could not resolve index for {file_id}: {e}")
+
+        return file_id
+
+    def embed_query(self, query: str) -> List[float]:
+        EMBEDDING_TEXTS.inc(kind="query")
+        with EMBEDDING_REQUEST_SECONDS.time(kind="query"):
+            query_embedding = self.embedding_model.embed_query(query)
+        if len(query_embedding) != EMBEDDING_DIMS:
+            raise ValueError(f"Query embedding has wrong dimension: {len(query_embedding)}")
+        return query_embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        EMBEDDING_TEXTS.inc(kind="query")
+        with EMBEDDING_REQUEST_SECONDS.time(kind="query"):
+            query_embedding = await self.embedding_model.aembed_query(query)
+        if len(query_embedding) != EMBEDDING_DIMS:
+            raise ValueError(f"Query embedding has wrong dimension: {len(query_embedding)}")
+        return query_embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in one request"""
+        EMBEDDING_TEXTS.inc(len(queries), kind="query")
+        with EMBEDDING_REQUEST_SECONDS.time(kind="query"):
+            embeddings = self.embedding_model.embed_documents(queries, task_type="retrieval_query")
+        if any(len(e) != EMBEDDING_DIMS for e in embeddings):
+            raise ValueError("Query embedding has wrong dimension")
+        return embeddings
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        EMBEDDING_TEXTS.inc(len(queries), kind="query")
+        with EMBEDDING_REQUEST_SECONDS.time(kind="query"):
+            embeddings = await self.embedding_model.aembed_documents(queries, task_type="retrieval_query")
+        if any(len(e) != EMBEDDING_DIMS for e in embeddings):
+            raise ValueError("Query embedding has wrong dimension")
+        return embeddings
+
+    def search_similar(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict]:
         """
         Search for similar chunks using vector similarity.
         
@@ -113,90 +400,458 @@ class VectorStore:
             file_id: Document identifier
             query: Search query
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of `query`, if the caller has one
             
         Returns:
             List of similar chunks with metadata
         """
         try:
-            print(f"🔍 Searching for: '{query[:50]}...'")
+            logger.debug(f"🔍 Searching for: '{query[:50]}...'")
             
             # Generate query embedding
-            query_embedding = self.embedding_model.embed_query(query)
-            
-            if len(query_embedding) != 768:
-                raise ValueError(f"Query embedding has wrong dimension: {len(query_embedding)}")
-            
-            # Use Supabase RPC function for vector search
-            result = self.supabase.rpc(
-                "match_embeddings",
-                {
-                    "query_embedding": query_embedding,
-                    "match_count": top_k,
-                    "filter_file_id": file_id
-                }
-            ).execute()
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+
+            index = self._local_index_for(file_id)
+            with VECTOR_SEARCH_SECONDS.time(backend=_backend(index), mode="single"):
+                if index is not None:
+                    chunks = index.search(self._stored_query(query_embedding), top_k, self.local_index.nprobe)
+                    logger.debug(f"✅ Found {len(chunks)} similar chunks (local index)")
+                    return chunks
+
+                # Use Supabase RPC function for vector search
+                result = self.supabase.rpc(*self._match_rpc(file_id, query_embedding, top_k)).execute()
             
             chunks = result.data if result.data else []
-            print(f"✅ Found {len(chunks)} similar chunks")
+            logger.debug(f"✅ Found {len(chunks)} similar chunks")
             
             return chunks
             
         except Exception as e:
-            print(f"❌ Search error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ Search error: {e}")
+            return []
+
+    async def asearch_similar(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict]:
+        """Async variant of search_similar for the request path"""
+        try:
+            logger.debug(f"🔍 Searching for: '{query[:50]}...'")
+
+            if query_embedding is None:
+                query_embedding = await self.aembed_query(query)
+
+            index = await self._alocal_index_for(file_id)
+            with VECTOR_SEARCH_SECONDS.time(backend=_backend(index), mode="single"):
+                if index is not None:
+                    chunks = index.search(self._stored_query(query_embedding), top_k, self.local_index.nprobe)
+                    logger.debug(f"✅ Found {len(chunks)} similar chunks (local index)")
+                    return chunks
+
+                client = self.async_supabase or await get_async_supabase()
+                result = await client.rpc(*self._match_rpc(file_id, query_embedding, top_k)).execute()
+
+            chunks = result.data if result.data else []
+            logger.debug(f"✅ Found {len(chunks)} similar chunks")
+
+            return chunks
+
+        except Exception as e:
+            logger.exception(f"❌ Search error: {e}")
+            return []
+
+    def search_similar_batch(
+        self,
+        file_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[Dict]]:
+        """
+        search_similar() for many queries against one document.
+
+        All queries are embedded in one request and scored together, either
+        in the local index or with a single match_embeddings_batch RPC.
+
+        Returns:
+            One result list per query, in the order of `queries`
+        """
+        if not queries:
+            return []
+        try:
+            logger.debug(f"🔍 Batch searching {len(queries)} queries")
+            if query_embeddings is None:
+                query_embeddings = self.embed_queries(queries)
+
+            index = self._local_index_for(file_id)
+            with VECTOR_SEARCH_SECONDS.time(backend=_backend(index), mode="batch"):
+                if index is not None:
+                    return index.search_batch(
+                        [self._stored_query(q) for q in query_embeddings], top_k, self.local_index.nprobe
+                    )
+
+                result = self.supabase.rpc(*self._match_batch_rpc(file_id, query_embeddings, top_k)).execute()
+                return self._group_batch_results(result.data, len(queries))
+
+        except Exception as e:
+            logger.exception(f"❌ Batch search error: {e}")
+            return [[] for _ in queries]
+
+    async def asearch_similar_batch(
+        self,
+        file_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[Dict]]:
+        """Async variant of search_similar_batch for the request path"""
+        if not queries:
             return []
+        try:
+            logger.debug(f"🔍 Batch searching {len(queries)} queries")
+            if query_embeddings is None:
+                query_embeddings = await self.aembed_queries(queries)
+
+            index = await self._alocal_index_for(file_id)
+            with VECTOR_SEARCH_SECONDS.time(backend=_backend(index), mode="batch"):
+                if index is not None:
+                    return index.search_batch(
+                        [self._stored_query(q) for q in query_embeddings], top_k, self.local_index.nprobe
+                    )
+
+                client = self.async_supabase or await get_async_supabase()
+                result = await client.rpc(*self._match_batch_rpc(file_id, query_embeddings, top_k)).execute()
+                return self._group_batch_results(result.data, len(queries))
+
+        except Exception as e:
+            logger.exception(f"❌ Batch search error: {e}")
+            return [[] for _ in queries]
+
+    # 🔹 Local index, while the document's embeddings are final
+    def _local_index_for(self, file_id: str) -> Optional[LocalVectorIndex]:
+        """None when searching in Supabase: other backend, or embeddings still being written"""
+        if not self.local_index:
+            return None
+        return self.local_index.get(file_id, self._load_vectors, self._index_version)
+
+    async def _alocal_index_for(self, file_id: str) -> Optional[LocalVectorIndex]:
+        if not self.local_index:
+            return None
+        index = self.local_index.cached(file_id)
+        if index is None:
+            # First query (or a due re-check) reads the version and maybe loads vectors
+            index = await asyncio.to_thread(
+                self.local_index.get, file_id, self._load_vectors, self._index_version
+            )
+        return index
+
+    def _index_version(self, file_id: str) -> Optional[str]:
+        """Stamp of a document's finished embeddings; None while they are being written"""
+        result = self.supabase.table("files")\
+            .select("processing_status")\
+            .eq("id", file_id)\
+            .execute()
+        status = (result.data[0].get("processing_status") if result.data else None) or {}
+        if not status.get("ai_ready"):
+            return None
+        # Documents indexed before indexed_at was recorded fall back to their chunk count
+        return str(status.get("indexed_at") or status.get("total_chunks") or "")
+
+    # 🔹 Search RPCs for the configured storage format
+
+    def _stored_query(self, query_embedding: List[float]) -> List[float]:
+        """Query vector comparable with the stored (possibly truncated) vectors"""
+        if self.embedding_storage == "compact":
+            return compact_query(query_embedding, self.compact_dims)
+        return query_embedding
+
+    def _match_rpc(self, file_id: str, query_embedding: List[float], top_k: int):
+        if self.embedding_storage == "compact":
+            return "match_embeddings_compact", {
+                "query_embedding": self._stored_query(query_embedding),
+                "match_count": top_k,
+                "candidate_count": max(self.rescore_candidates, top_k),
+                "filter_file_id": file_id
+            }
+        return "match_embeddings", {
+            "query_embedding": query_embedding,
+            "match_count": top_k,
+            "filter_file_id": file_id
+        }
+
+    def _match_batch_rpc(self, file_id: str, query_embeddings: List[List[float]], top_k: int):
+        if self.embedding_storage == "compact":
+            return "match_embeddings_compact_batch", {
+                "query_embeddings": [self._stored_query(q) for q in query_embeddings],
+                "match_count": top_k,
+                "candidate_count": max(self.rescore_candidates, top_k),
+                "filter_file_id": file_id
+            }
+        return "match_embeddings_batch", {
+            "query_embeddings": query_embeddings,
+            "match_count": top_k,
+            "filter_file_id": file_id
+        }
+
+    @staticmethod
+    def _group_batch_results(rows: Optional[List[Dict]], query_count: int) -> List[List[Dict]]:
+        grouped = [[] for _ in range(query_count)]
+        for row in rows or []:
+            row = dict(row)
+            grouped[row.pop("query_index")].append(row)
+        return grouped
+
+    # 🔹 Hybrid retrieval: BM25 over the lexical index fused with vector search
+    def store_lexical_index(self, file_id: str, chunks: List[Dict]):
+        """
+        Build and store the BM25 index of a document.
+
+        Args:
+            file_id: Document identifier
+            chunks: Every chunk of the document, as dicts with chunk_id, page, text
+        """
+        index = LexicalIndex.build(chunks)
+        self.supabase.table("lexical_indexes").upsert({
+            "file_id": file_id,
+            "data": index.dumps(),
+            "chunk_count": len(chunks)
+        }, on_conflict="file_id").execute()
+        self.lexical_cache.put(file_id, index)
+        logger.info(f"🔤 Stored lexical index: {len(index.postings)} terms over {len(chunks)} chunks")
+
+    def load_lexical_index(self, file_id: str) -> Optional[LexicalIndex]:
+        found, index = self.lexical_cache.get(file_id)
+        if found:
+            return index
+        result = self.supabase.table("lexical_indexes")\
+            .select("data")\
+            .eq("file_id", file_id)\
+            .execute()
+        index = LexicalIndex.loads(result.data[0]["data"]) if result.data else None
+        self.lexical_cache.put(file_id, index)
+        return index
+
+    async def aload_lexical_index(self, file_id: str) -> Optional[LexicalIndex]:
+        found, index = self.lexical_cache.get(file_id)
+        if found:
+            return index
+        client = self.async_supabase or await get_async_supabase()
+        result = await client.table("lexical_indexes")\
+            .select("data")\
+            .eq("file_id", file_id)\
+            .execute()
+        index = LexicalIndex.loads(result.data[0]["data"]) if result.data else None
+        self.lexical_cache.put(file_id, index)
+        return index
+
+    def hybrid_search(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None,
+        candidates: int = 20
+    ) -> List[Dict]:
+        """
+        Vector and BM25 search fused with reciprocal rank fusion.
 
-    def get_all_chunks(self, file_id: str) -> List[Dict]:
-        """Get all chunks for a specific file"""
+        Exact terms such as names, IDs and emails are found by BM25 even when
+        their embedding is not close to the query's. Documents without a
+        lexical index fall back to vector search alone.
+        """
+        vector_hits = self.search_similar(file_id, query, top_k=candidates, query_embedding=query_embedding)
         try:
+            lexical = self.load_lexical_index(file_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Lexical index unavailable: {e}")
+            lexical = None
+        if lexical is None or not _has_chunk_ids(vector_hits):
+            return vector_hits[:top_k]
+
+        lexical_hits = lexical.search(query, top_k=candidates)
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], top_k)
+        missing = [c["chunk_id"] for c in fused if "content" not in c]
+        if missing:
+            contents = self._chunk_contents(file_id, missing)
+            fused = [{**c, "content": contents.get(c["chunk_id"], "")} if "content" not in c else c for c in fused]
+
+        logger.debug(f"🔀 Hybrid search: {len(vector_hits)} vector + {len(lexical_hits)} lexical -> {len(fused)}")
+        return fused
+
+    async def ahybrid_search(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None,
+        candidates: int = 20
+    ) -> List[Dict]:
+        """Async variant of hybrid_search for the request path"""
+        vector_hits, lexical = await asyncio.gather(
+            self.asearch_similar(file_id, query, top_k=candidates, query_embedding=query_embedding),
+            self.aload_lexical_index(file_id),
+            return_exceptions=True
+        )
+        if isinstance(vector_hits, BaseException):
+            raise vector_hits
+        if isinstance(lexical, BaseException):
+            logger.warning(f"⚠️ Lexical index unavailable: {lexical}")
+            lexical = None
+        if lexical is None or not _has_chunk_ids(vector_hits):
+            return vector_hits[:top_k]
+
+        lexical_hits = lexical.search(query, top_k=candidates)
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], top_k)
+        missing = [c["chunk_id"] for c in fused if "content" not in c]
+        if missing:
+            contents = await self._achunk_contents(file_id, missing)
+            fused = [{**c, "content": contents.get(c["chunk_id"], "")} if "content" not in c else c for c in fused]
+
+        logger.debug(f"🔀 Hybrid search: {len(vector_hits)} vector + {len(lexical_hits)} lexical -> {len(fused)}")
+        return fused
+
+    def _chunk_contents(self, file_id: str, chunk_ids: List[int]) -> Dict[int, str]:
+        local = self._local_contents(file_id, chunk_ids)
+        if local is not None:
+            return local
+        result = self.supabase.table("embeddings")\
+            .select("chunk_id, content")\
+            .eq("file_id", file_id)\
+            .in_("chunk_id", chunk_ids)\
+            .execute()
+        return {row["chunk_id"]: row["content"] for row in result.data or []}
+
+    async def _achunk_contents(self, file_id: str, chunk_ids: List[int]) -> Dict[int, str]:
+        local = self._local_contents(file_id, chunk_ids)
+        if local is not None:
+            return local
+        client = self.async_supabase or await get_async_supabase()
+        result = await client.table("embeddings")\
+            .select("chunk_id, content")\
+            .eq("file_id", file_id)\
+            .in_("chunk_id", chunk_ids)\
+            .execute()
+        return {row["chunk_id"]: row["content"] for row in result.data or []}
+
+    def _local_contents(self, file_id: str, chunk_ids: List[int]) -> Optional[Dict[int, str]]:
+        """Chunk text from the local vector index, when one is loaded"""
+        index = self.local_index.cached(file_id) if self.local_index else None
+        if index is None:
+            return None
+        wanted = set(chunk_ids)
+        return {m["chunk_id"]: m["content"] for m in index.meta if m["chunk_id"] in wanted}
+
+    def _load_vectors(self, file_id: str) -> List[Dict]:
+        """Every embedding of a document, for building a local index"""
+        # Compact rows are loaded under the same key, renamed by PostgREST
+        column = "embedding:embedding_half" if self.embedding_storage == "compact" else "embedding"
+        return list(self.iter_chunks(file_id, columns=f"id, chunk_id, page, content, {column}"))
+
+    def iter_chunks(
+        self,
+        file_id: str,
+        columns: str = "chunk_id, page, content",
+        page_size: int = 500
+    ) -> Iterator[Dict]:
+        """
+        Stream a document's chunks in page order.
+
+        Rows are fetched `page_size` at a time with keyset pagination on
+        chunk_id (chunk ids are assigned in page order), so memory stays flat
+        and no request scans past rows already returned. Only `columns` are
+        fetched; vectors are left out unless asked for.
+        """
+        if columns != "*" and "chunk_id" not in [c.strip() for c in columns.split(",")]:
+            columns = f"chunk_id, {columns}"
+
+        last_chunk_id = -1
+        while True:
             result = self.supabase.table("embeddings")\
-                .select("*")\
+                .select(columns)\
                 .eq("file_id", file_id)\
+                .gt("chunk_id", last_chunk_id)\
                 .order("chunk_id")\
+                .limit(page_size)\
                 .execute()
-            
-            return result.data if result.data else []
+            rows = result.data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_chunk_id = rows[-1]["chunk_id"]
+
+    def get_all_chunks(self, file_id: str, columns: str = "chunk_id, page, content") -> List[Dict]:
+        """Get all chunks for a specific file (without vectors unless requested)"""
+        try:
+            return list(self.iter_chunks(file_id, columns=columns))
             
         except Exception as e:
-            print(f"❌ Error getting chunks: {e}")
+            logger.error(f"❌ Error getting chunks: {e}")
             return []
 
     def delete_file_embeddings(self, file_id: str):
         """Delete all embeddings for a specific file"""
         try:
+            linked = self.supabase.table("files")\
+                .select("id")\
+                .eq("index_file_id", file_id)\
+                .execute()
+            if linked.data:
+                raise ValueError(f"Embeddings of {file_id} are shared with {len(linked.data)} other documents")
+
             result = self.supabase.table("embeddings")\
                 .delete()\
                 .eq("file_id", file_id)\
                 .execute()
+            self.supabase.table("lexical_indexes")\
+                .delete()\
+                .eq("file_id", file_id)\
+                .execute()
+            self.lexical_cache.invalidate(file_id)
+            if self.local_index:
+                self.local_index.invalidate(file_id)
             
-            print(f"✅ Deleted embeddings for file {file_id}")
+            logger.info(f"✅ Deleted embeddings for file {file_id}")
             return result
             
         except Exception as e:
-            print(f"❌ Error deleting embeddings: {e}")
+            logger.error(f"❌ Error deleting embeddings: {e}")
             raise
 
     def get_document_stats(self, file_id: str) -> Dict:
         """Get statistics about stored embeddings for a document"""
         try:
-            result = self.supabase.table("embeddings")\
-                .select("chunk_id, page")\
-                .eq("file_id", file_id)\
-                .execute()
+            # Aggregated in the database; no chunk rows are transferred
+            result = self.supabase.rpc(
+                "document_chunk_stats",
+                {"filter_file_id": file_id}
+            ).execute()
             
-            if not result.data:
+            stats = result.data[0] if result.data else None
+            if not stats or not stats.get("total_chunks"):
                 return {"total_chunks": 0, "pages": []}
             
-            chunks = result.data
-            pages = list(set(chunk["page"] for chunk in chunks))
-            
             return {
-                "total_chunks": len(chunks),
-                "pages": sorted(pages),
-                "page_count": len(pages)
+                "total_chunks": stats["total_chunks"],
+                "pages": stats["pages"] or [],
+                "page_count": stats["page_count"]
             }
             
         except Exception as e:
-            print(f"❌ Error getting stats: {e}")
+            logger.error(f"❌ Error getting stats: {e}")
             return {"total_chunks": 0, "pages": [], "error": str(e)}
+
+
+def _backend(index: Optional[LocalVectorIndex]) -> str:
+    return "local" if index is not None else "supabase"
+
+
+def _has_chunk_ids(chunks: List[Dict]) -> bool:
+    """Fusion keys on chunk_id; a match_embeddings predating migration 011 omits it"""
+    if all("chunk_id" in c for c in chunks):
+        return True
+    logger.warning("⚠️ Vector hits carry no chunk_id, skipping lexical fusion (apply migration 011)")
+    return False
@@ -90,6 +90,11 @@ const Sidebar: React.FC<SidebarProps> = ({ pdfData }) => {
                         </span>
                         <StatusIndicator isComplete={status.ai_ready} />
                     </div>
+                    {!status.ai_ready && status.partially_ready && (
+                        <p className="text-[11px] text-amber-600">
+                            Pages 1–{status.indexed_through_page} can already be queried
+                        </p>
+                    )}
                     
                 </div>
             </div>
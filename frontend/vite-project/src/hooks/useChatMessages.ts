@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import { useUser } from '@clerk/clerk-react';
 import supabase from '../utils/supabase';
 import { formatAIResponse } from '../utils/formatAIResponse';
+import { streamAnswer } from '../utils/streamAnswer';
 
 export interface Message {
     id: string;
@@ -19,6 +20,7 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
     const { user } = useUser();
     const [messages, setMessages] = useState<Message[]>([]);
     const [isProcessing, setIsProcessing] = useState(false);
+    const [isStreaming, setIsStreaming] = useState(false);
 
     // 🔹 Load existing messages from Supabase on mount
     useEffect(() => {
@@ -65,6 +67,7 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
         if (!user || !documentId) return;
 
         setIsProcessing(true);
+        const streamId = `stream-${Date.now()}`;
 
         try {
             // 1️⃣ Add user message to Supabase
@@ -90,22 +93,33 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
 
             setMessages(prev => [...prev, newUserMessage]);
 
-            // 2️⃣ Call AI backend
-            const response = await fetch('https://ai-pdf-analyzer-production.up.railway.app/ask-question', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ 
-                    question: text, 
+            // 2️⃣ Stream AI answer from backend, rendering tokens as they arrive
+            let partial = '';
+            const { answer } = await streamAnswer(
+                'https://ai-pdf-analyzer-production.up.railway.app/ask-question/stream',
+                {
+                    question: text,
                     document_id: documentId,
                     user_id: user.id  // ✅ Pass user_id to backend
-                })
-            });
+                },
+                (token) => {
+                    partial += token;
+                    setIsStreaming(true);
 
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const data = await response.json();
+                    const streamed: Message = {
+                        id: streamId,
+                        type: 'ai',
+                        text: formatAIResponse(partial),
+                        timestamp: new Date().toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit' })
+                    };
+                    setMessages(prev => prev.some(m => m.id === streamId)
+                        ? prev.map(m => m.id === streamId ? streamed : m)
+                        : [...prev, streamed]);
+                }
+            );
 
-            const safeAnswer = typeof data.answer === 'string' && data.answer.trim()
-                ? data.answer
+            const safeAnswer = typeof answer === 'string' && answer.trim()
+                ? answer
                 : "I couldn't find this information in the document.";
 
             // 3️⃣ Store AI message in Supabase
@@ -131,7 +145,8 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
                 timestamp: new Date(aiMsg.created_at).toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit' })
             };
 
-            setMessages(prev => [...prev, newAiMessage]);
+            // Swap the streamed placeholder for the stored message
+            setMessages(prev => [...prev.filter(m => m.id !== streamId), newAiMessage]);
 
         } catch (err) {
             console.error('Error sending message:', err);
@@ -142,9 +157,10 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
                 text: 'Sorry, I encountered an error processing your question. Please try again.',
                 timestamp: new Date().toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit' })
             };
-            setMessages(prev => [...prev, errorMessage]);
+            setMessages(prev => [...prev.filter(m => m.id !== streamId), errorMessage]);
         } finally {
             setIsProcessing(false);
+            setIsStreaming(false);
         }
     };
 
@@ -158,5 +174,5 @@ export const useChatMessages = ({ documentId }: UseChatMessagesProps) => {
         }]);
     };
 
-    return { messages, isProcessing, handleSendMessage, handleClearChat };
+    return { messages, isProcessing, isStreaming, handleSendMessage, handleClearChat };
 };
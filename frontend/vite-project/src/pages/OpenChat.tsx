@@ -50,6 +50,7 @@ const OpenChat: React.FC = () => {
   const {
     messages,
     isProcessing,
+    isStreaming,
     handleSendMessage,
     handleClearChat
   } = useChatMessages({ documentId: pdfData.documentId });
@@ -86,6 +87,9 @@ useEffect(() => {
       if (newData.processing_status?.ai_ready) {
         console.log('✅ AI Ready — stopping loader');
         setIsPdfProcessing(false);
+      } else if (newData.processing_status?.partially_ready) {
+        // Indexed pages can already be queried while the rest finishes
+        setIsPdfProcessing(false);
       }
 
       if (newData.processing_status?.error) {
@@ -228,7 +232,7 @@ useEffect(() => {
               <ChatMessage key={msg.id} message={msg} />
             ))}
 
-            {isProcessing && (
+            {isProcessing && !isStreaming && (
               <ChatMessage
                 message={{
                   id: `proc-${Date.now()}`,
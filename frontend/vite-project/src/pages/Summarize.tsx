@@ -124,40 +124,55 @@ const Summarize: React.FC = () => {
     };
   }, [pdfData.documentId]);
 
-  // Poll status as fallback
+  // Live progress pushed by the backend
   useEffect(() => {
     if (!pdfData.documentId || !isPdfProcessing) return;
 
-    const pollStatus = async () => {
-      try {
-        const response = await fetch(`${API_URL}/processing-status/${pdfData.documentId}`);
-        if (!response.ok) return;
+    const source = new EventSource(`${API_URL}/processing-status/${pdfData.documentId}/stream`);
+
+    source.addEventListener('progress', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      const status = data.processing_status;
+      if (!status) return;
+
+      setPdfData(prev => ({
+        ...prev,
+        totalPages: data.pages ?? prev.totalPages,
+        language: data.language ?? prev.language,
+        wordCount: data.word_count ?? prev.wordCount,
+        processingStatus: status
+      }));
+
+      if (status.ai_ready) {
+        setProcessingProgress(100);
+        setIsPdfProcessing(false);
+        source.close();
+      } else if (status.error) {
+        setError(status.error);
+        setIsPdfProcessing(false);
+        source.close();
+      } else {
+        const progress = status.total_chunks > 0
+          ? Math.floor((status.current_chunk / status.total_chunks) * 100)
+          : status.text_extraction ? 30 : 10;
+        setProcessingProgress(progress);
+      }
+    });
 
-        const data = await response.json();
-        
-        if (data.processing_status?.ai_ready) {
-          setPdfData(prev => ({
-            ...prev,
-            totalPages: data.pages,
-            language: data.language,
-            wordCount: data.word_count,
-            processingStatus: data.processing_status
-          }));
-          setProcessingProgress(100);
-          setIsPdfProcessing(false);
-        } else if (data.processing_status?.error) {
-          setError(data.processing_status.error);
-          setIsPdfProcessing(false);
-        }
-      } catch (err) {
-        console.error('Polling error:', err);
+    source.onerror = (event) => {
+      const data = (event as MessageEvent).data;
+      if (data) {
+        // Sent by the backend, e.g. unknown document: do not reconnect
+        setError(JSON.parse(data).error);
+        setIsPdfProcessing(false);
+        source.close();
+      } else {
+        // Network error: EventSource reconnects by itself
+        console.error('Progress stream error:', event);
       }
     };
 
-    const interval = setInterval(pollStatus, 2000);
-    pollStatus();
-
-    return () => clearInterval(interval);
+    return () => source.close();
   }, [pdfData.documentId, isPdfProcessing]);
 
   // Generate summary
@@ -10,5 +10,8 @@ export interface PDFMetadata {
     text_extraction: boolean;
     vector_embedding: boolean;
     ai_ready: boolean;
+    // Set while early pages are already searchable during ingest
+    partially_ready?: boolean;
+    indexed_through_page?: number;
   };
 }
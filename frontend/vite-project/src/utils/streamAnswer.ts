@@ -0,0 +1,55 @@
+export interface StreamedAnswer {
+  answer: string;
+  pages: number[];
+}
+
+// Read the server-sent events of /ask-question/stream.
+// Calls onToken for every generated token and resolves with the final answer.
+export const streamAnswer = async (
+  url: string,
+  body: Record<string, unknown>,
+  onToken: (text: string) => void
+): Promise<StreamedAnswer> => {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok || !response.body) throw new Error(`HTTP error! status: ${response.status}`);
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result: StreamedAnswer | null = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+      if (!dataLine) continue;
+
+      const event = JSON.parse(dataLine.slice('data: '.length));
+      if (event.type === 'token') {
+        onToken(event.text);
+      } else if (event.type === 'done') {
+        result = { answer: event.answer, pages: event.pages ?? [] };
+      } else if (event.type === 'error') {
+        throw new Error(event.answer);
+      }
+    }
+  }
+
+  if (!result) throw new Error('Answer stream ended unexpectedly');
+  return result;
+};